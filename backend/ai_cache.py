@@ -0,0 +1,132 @@
+import asyncio
+import copy
+import hashlib
+import json
+import os
+
+from backend.cache import LRUCache
+from backend.database import db_cursor
+from backend.repository import run_in_db
+
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", "3600"))
+AI_CACHE_MAX_BYTES = int(os.getenv("AI_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Also keep responses in the ai_cache table so they survive restarts and are shared by workers
+AI_CACHE_PERSIST = os.getenv("AI_CACHE_PERSIST", "false").lower() in ("1", "true", "yes")
+_PURGE_EVERY = 100
+
+
+class AiResponseCache:
+    """LRU (optionally Postgres-backed) cache with single-flight for chat completions.
+
+    Concurrent requests for the same key share one upstream call instead
+    of each calling the provider. Error results are shared with waiters
+    but never stored. The shared call is cancelled once every request
+    waiting on it has gone (disconnected, timed out, lost a hedge).
+    """
+
+    def __init__(self, ttl: float = AI_CACHE_TTL, max_bytes: int = AI_CACHE_MAX_BYTES,
+                 persist: bool = AI_CACHE_PERSIST):
+        self.ttl = ttl
+        self.persist = persist
+        self._lru = LRUCache(max_bytes)
+        self._in_flight = {}
+        self._waiters = {}  # in-flight task -> requests awaiting it
+        self._stores = 0
+        self.coalesced = 0
+        self.tokens_saved = 0
+
+    @staticmethod
+    def key(provider: str, model: str, system_prompt: str, prompt: str, api_key: str = "") -> str:
+        # The credential is part of the key: a cached answer is only served to callers with the same key
+        key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+        normalized = [provider.lower(), model, (system_prompt or "").strip(), (prompt or "").strip(), key_hash]
+        return hashlib.sha256(json.dumps(normalized).encode("utf-8")).hexdigest()
+
+    async def get_or_compute(self, key: str, compute) -> dict:
+        entry = self._lru.get(key)
+        if entry is not None:
+            return self._mark(entry.value, "hit")
+
+        task = self._in_flight.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.create_task(self._compute(key, compute))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            # Shielded so one caller going away does not cancel the call the others are waiting on
+            result, state = await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                # Nobody left to answer: stop paying for the upstream call
+                if not task.done():
+                    task.cancel()
+        return self._mark(result, state if leader else "coalesced")
+
+    async def _compute(self, key: str, compute):
+        if self.persist:
+            result = await self._load(key)
+            if result is not None:
+                return result, "hit"
+        result = await compute()
+        if "error" not in result:
+            await self._store(key, result)
+        return result, "miss"
+
+    def _mark(self, result: dict, state: str) -> dict:
+        marked = copy.copy(result)
+        marked["cache"] = state
+        if state != "miss" and "error" not in result:
+            usage = result.get("usage") or {}
+            saved = (usage.get("input_tokens") or 0) + (usage.get("output_tokens") or 0)
+            marked["tokens_saved"] = saved
+            self.tokens_saved += saved
+        return marked
+
+    async def _store(self, key: str, result: dict):
+        payload = json.dumps(result)
+        self._lru.set(key, result, len(payload), self.ttl)
+        if self.persist:
+            self._stores += 1
+            await run_in_db(self._persist, key, payload, self._stores % _PURGE_EVERY == 0)
+
+    async def _load(self, key: str):
+        payload = await run_in_db(self._fetch, key)
+        if payload is None:
+            return None
+        # The row's remaining lifetime is not tracked; promote it with a fresh TTL
+        self._lru.set(key, payload, len(json.dumps(payload)), self.ttl)
+        return payload
+
+    def _persist(self, key: str, payload: str, purge: bool):
+        with db_cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO ai_cache (key, response, expires_at)
+                VALUES (%s, %s, now() + make_interval(secs => %s))
+                ON CONFLICT (key) DO UPDATE SET response = EXCLUDED.response, expires_at = EXCLUDED.expires_at
+                """,
+                (key, payload, self.ttl),
+            )
+            if purge:
+                cur.execute("DELETE FROM ai_cache WHERE expires_at < now()")
+
+    def _fetch(self, key: str):
+        with db_cursor() as cur:
+            cur.execute("SELECT response FROM ai_cache WHERE key = %s AND expires_at > now()", (key,))
+            row = cur.fetchone()
+            return row["response"] if row else None
+
+    def stats(self) -> dict:
+        return {
+            **self._lru.stats(),
+            "persist": self.persist,
+            "in_flight": len(self._in_flight),
+            "coalesced": self.coalesced,
+            "tokens_saved": self.tokens_saved,
+        }
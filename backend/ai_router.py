@@ -0,0 +1,224 @@
+import asyncio
+import bisect
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from backend.ai_service import DEFAULT_MODELS
+
+AI_ROUTE_ORDER = [p.strip() for p in os.getenv("AI_ROUTE_ORDER", "anthropic,openai,deepseek").split(",") if p.strip()]
+AI_ROUTE_TIMEOUT = float(os.getenv("AI_ROUTE_TIMEOUT", "60"))
+AI_HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", "0.95"))
+# Until a provider has this many samples, hedge after AI_HEDGE_DEFAULT_DELAY seconds
+AI_HEDGE_MIN_SAMPLES = int(os.getenv("AI_HEDGE_MIN_SAMPLES", "20"))
+AI_HEDGE_DEFAULT_DELAY = float(os.getenv("AI_HEDGE_DEFAULT_DELAY", "10"))
+AI_HEDGE_MIN_DELAY = float(os.getenv("AI_HEDGE_MIN_DELAY", "0.5"))
+# Distinct provider/model stats kept; further models share one "<provider>/__other__" entry
+AI_ROUTE_MAX_STATS = int(os.getenv("AI_ROUTE_MAX_STATS", "50"))
+WINDOW_SIZE = 200
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+
+class ProviderStats:
+    """Rolling latency/error window plus a cumulative latency histogram for one provider/model."""
+
+    def __init__(self, window: int = WINDOW_SIZE):
+        self._window = deque(maxlen=window)  # (latency_s, ok)
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.requests = 0
+        self.errors = 0
+
+    def observe(self, latency: float, ok: bool):
+        self._window.append((latency, ok))
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency * 1000)] += 1
+        self.requests += 1
+        if not ok:
+            self.errors += 1
+
+    @property
+    def samples(self) -> int:
+        return len(self._window)
+
+    def error_rate(self) -> float:
+        if not self._window:
+            return 0.0
+        return sum(1 for _, ok in self._window if not ok) / len(self._window)
+
+    def percentile(self, q: float) -> Optional[float]:
+        latencies = sorted(latency for latency, ok in self._window if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def to_dict(self) -> dict:
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "window_samples": self.samples,
+            "window_error_rate": round(self.error_rate(), 4),
+            "p50_ms": ms(self.percentile(0.5)),
+            "p95_ms": ms(self.percentile(0.95)),
+            "p99_ms": ms(self.percentile(0.99)),
+            "histogram_ms": {
+                **{f"le_{b}": c for b, c in zip(LATENCY_BUCKETS_MS, self.bucket_counts)},
+                "gt_last": self.bucket_counts[-1],
+            },
+        }
+
+
+class AiRouter:
+    """Sends chats through AiService while tracking per-provider latency and errors.
+
+    Without routing a request goes only to the provider it names (its
+    latency is still recorded). With routing, failures and timeouts fall
+    back to the next configured provider, healthiest first. With hedging,
+    a second provider is started once the first has run past its
+    percentile latency. The first success wins and the other is cancelled.
+    """
+
+    def __init__(self, ai_service, order: list = None, timeout: float = AI_ROUTE_TIMEOUT,
+                 hedge_percentile: float = AI_HEDGE_PERCENTILE, decisions_kept: int = 100):
+        self.ai_service = ai_service
+        self.order = order or AI_ROUTE_ORDER
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self._stats = {}
+        self._decisions = deque(maxlen=decisions_kept)
+
+    def _stats_for(self, provider: str, model: Optional[str]) -> ProviderStats:
+        """Stats for a known provider; ``model`` comes from the request, so new keys are capped."""
+        key = f"{provider}/{model or DEFAULT_MODELS[provider]}"
+        stats = self._stats.get(key)
+        if stats is None:
+            if len(self._stats) >= AI_ROUTE_MAX_STATS:
+                key = f"{provider}/__other__"
+                stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = ProviderStats()
+        return stats
+
+    def _candidates(self, provider: str, model: Optional[str], api_key: Optional[str]) -> list:
+        """(provider, model, api_key) attempts: the requested one, then healthy fallbacks."""
+        candidates = [(provider, model, api_key)]
+        fallbacks = [
+            p for p in self.order
+            if p != provider and p in DEFAULT_MODELS and getattr(self.ai_service, f"{p}_key", "")
+        ]
+
+        def health(p):
+            stats = self._stats_for(p, None)
+            return (round(stats.error_rate(), 1), stats.percentile(0.5) or float("inf"))
+
+        fallbacks.sort(key=health)
+        # A per-request key or model only applies to the provider it was given for
+        candidates.extend((p, None, None) for p in fallbacks)
+        return candidates
+
+    def _hedge_delay(self, provider: str, model: Optional[str]) -> float:
+        if provider not in DEFAULT_MODELS:
+            return AI_HEDGE_DEFAULT_DELAY
+        stats = self._stats_for(provider, model)
+        if stats.samples < AI_HEDGE_MIN_SAMPLES:
+            return AI_HEDGE_DEFAULT_DELAY
+        return max(AI_HEDGE_MIN_DELAY, stats.percentile(self.hedge_percentile) or AI_HEDGE_DEFAULT_DELAY)
+
+    async def _attempt(self, candidate, prompt, system_prompt, use_cache, timeout):
+        provider, model, api_key = candidate
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                self.ai_service.chat(
+                    prompt=prompt,
+                    provider=provider,
+                    model=model,
+                    system_prompt=system_prompt,
+                    api_key=api_key,
+                    use_cache=use_cache,
+                ),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            result = {"error": f"{provider} timed out after {timeout}s"}
+        latency = time.perf_counter() - start
+        # Cache hits say nothing about provider latency; unknown providers fail without a call
+        if provider in DEFAULT_MODELS and result.get("cache") not in ("hit", "coalesced"):
+            self._stats_for(provider, model).observe(latency, "error" not in result)
+        return candidate, result, latency
+
+    async def chat(
+        self,
+        prompt: str,
+        provider: str = "anthropic",
+        model: Optional[str] = None,
+        system_prompt: str = "You are a helpful assistant.",
+        api_key: Optional[str] = None,
+        use_cache: bool = True,
+        routing: bool = False,
+        hedge: bool = False,
+    ) -> dict:
+        candidates = self._candidates(provider, model, api_key) if routing else [(provider, model, api_key)]
+        timeout = self.timeout if routing else None
+        decision = {"at": time.time(), "requested": provider, "served_by": None, "hedged": False, "attempts": []}
+        pending = set()
+        providers = {}
+        launched = 0
+
+        def launch():
+            nonlocal launched
+            candidate = candidates[launched]
+            launched += 1
+            task = asyncio.create_task(self._attempt(candidate, prompt, system_prompt, use_cache, timeout))
+            providers[task] = candidate[0]
+            pending.add(task)
+
+        launch()
+        result = None
+        try:
+            while pending:
+                hedge_delay = None
+                if hedge and routing and len(pending) == 1 and launched < len(candidates):
+                    hedge_delay = self._hedge_delay(*candidates[launched - 1][:2])
+                done, pending = await asyncio.wait(pending, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    decision["hedged"] = True
+                    launch()
+                    continue
+                for task in done:
+                    (attempt_provider, _, _), attempt_result, latency = task.result()
+                    decision["attempts"].append({
+                        "provider": attempt_provider,
+                        "ok": "error" not in attempt_result,
+                        "latency_ms": round(latency * 1000, 1),
+                    })
+                    if "error" not in attempt_result:
+                        decision["served_by"] = attempt_provider
+                        result = attempt_result
+                    elif result is None or "error" in result:
+                        result = attempt_result
+                if decision["served_by"]:
+                    break
+                if not pending and launched < len(candidates):
+                    launch()
+        finally:
+            # Cancel the hedging loser (or anything left over after a success)
+            for task in pending:
+                task.cancel()
+                decision["attempts"].append({"provider": providers[task], "cancelled": True})
+            self._decisions.append(decision)
+
+        if routing:
+            result = {**result, "routing": decision}
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "order": self.order,
+            "timeout_s": self.timeout,
+            "hedge_percentile": self.hedge_percentile,
+            "providers": {key: stats.to_dict() for key, stats in self._stats.items()},
+            "recent_decisions": list(self._decisions),
+        }
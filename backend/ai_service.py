@@ -1,12 +1,141 @@
+import asyncio
+import hashlib
+import importlib
 import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from typing import Optional
 
+from backend.metrics import ai_request_duration, ai_requests_total, ai_tokens_total
+
+# Cached SDK clients are closed after this long, or when the cache is full
+AI_CLIENT_TTL = float(os.getenv("AI_CLIENT_TTL", "600"))
+AI_CLIENT_CACHE_SIZE = int(os.getenv("AI_CLIENT_CACHE_SIZE", "32"))
+# When the provider SDKs get imported: "background" (at startup, off the event loop),
+# "blocking" (before the app serves requests) or "lazy" (on the first chat)
+AI_SDK_WARMUP = os.getenv("AI_SDK_WARMUP", "background")
+SDK_MODULES = ("anthropic", "openai")  # DeepSeek goes through the openai SDK
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+DEFAULT_MODELS = {
+    "anthropic": "claude-sonnet-4-20250514",
+    "openai": "gpt-4o",
+    "deepseek": "deepseek-chat",
+}
+
+
+def _observe(provider: str, model: str, start: float, result: dict):
+    """Record one provider call: outcome, duration and reported token usage."""
+    model = result.get("model") or model
+    outcome = "error" if result.get("error") else "ok"
+    ai_requests_total.labels(provider, model, outcome).inc()
+    ai_request_duration.labels(provider, model).observe(time.perf_counter() - start)
+    for direction in ("input", "output"):
+        tokens = (result.get("usage") or {}).get(f"{direction}_tokens")
+        if tokens:
+            ai_tokens_total.labels(provider, model, direction).inc(tokens)
+
+
+def _create_client(provider: str, api_key: str, base_url: Optional[str]):
+    if provider == "anthropic":
+        from anthropic import AsyncAnthropic
+
+        return AsyncAnthropic(api_key=api_key)
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(api_key=api_key, base_url=base_url)
+
+
+class _ClientEntry:
+    __slots__ = ("client", "created_at", "users", "evicted")
+
+    def __init__(self, client):
+        self.client = client
+        self.created_at = time.monotonic()
+        self.users = 0
+        self.evicted = False
+
 
 class AiService:
-    def __init__(self):
+    def __init__(self, client_factory=_create_client, client_ttl: float = AI_CLIENT_TTL,
+                 max_clients: int = AI_CLIENT_CACHE_SIZE, cache=None):
         self.anthropic_key = os.getenv("ANTHROPIC_API_KEY", "")
         self.openai_key = os.getenv("OPENAI_API_KEY", "")
         self.deepseek_key = os.getenv("DEEPSEEK_API_KEY", "")
+        self._client_factory = client_factory
+        self.client_ttl = client_ttl
+        self.max_clients = max_clients
+        # (provider, sha256(api_key), base_url) -> _ClientEntry, least recently used first
+        self._clients = OrderedDict()
+        self._clients_created = 0
+        # Optional AiResponseCache placed in front of chat()
+        self.cache = cache
+        # SDK module -> import time in ms (None if not installed), filled by warmup()
+        self.sdk_imports = {}
+
+    async def warmup(self):
+        """Import the provider SDKs in a thread so the first chat does not pay for it."""
+        for module in SDK_MODULES:
+            if module in self.sdk_imports:
+                continue
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(importlib.import_module, module)
+                self.sdk_imports[module] = round((time.perf_counter() - start) * 1000, 1)
+            except ImportError:
+                self.sdk_imports[module] = None
+
+    @asynccontextmanager
+    async def _client(self, provider: str, api_key: str, base_url: Optional[str] = None):
+        """Borrow a cached async SDK client; its HTTP connection pool is reused across calls."""
+        key = (provider, hashlib.sha256((api_key or "").encode()).hexdigest(), base_url)
+        entry = self._clients.get(key)
+        if entry is not None and time.monotonic() - entry.created_at > self.client_ttl:
+            await self._evict(key)
+            # Another request may have replaced it while the old client was closing
+            entry = self._clients.get(key)
+        if entry is None:
+            entry = _ClientEntry(self._client_factory(provider, api_key, base_url))
+            self._clients[key] = entry
+            self._clients_created += 1
+            while len(self._clients) > self.max_clients:
+                await self._evict(next(iter(self._clients)))
+        self._clients.move_to_end(key)
+        entry.users += 1
+        try:
+            yield entry.client
+        finally:
+            entry.users -= 1
+            # Evicted while a request was still using it: close once the last one finishes
+            if entry.evicted and entry.users == 0:
+                await entry.client.close()
+
+    async def _evict(self, key):
+        entry = self._clients.pop(key, None)
+        if entry is None:
+            return
+        entry.evicted = True
+        if entry.users == 0:
+            await entry.client.close()
+
+    async def aclose(self):
+        for key in list(self._clients):
+            await self._evict(key)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "cached_clients": len(self._clients),
+            "clients_created_total": self._clients_created,
+            "clients": [
+                {"provider": provider, "base_url": base_url, "in_use": entry.users,
+                 "age_s": round(now - entry.created_at, 1)}
+                for (provider, _, base_url), entry in self._clients.items()
+            ],
+            "cache": self.cache.stats() if self.cache else None,
+            "sdk_imports_ms": self.sdk_imports,
+        }
 
     async def chat(
         self,
@@ -15,32 +144,134 @@ class AiService:
         model: Optional[str] = None,
         system_prompt: str = "You are a helpful assistant.",
         api_key: Optional[str] = None,
+        use_cache: bool = True,
     ) -> dict:
+        if self.cache is None or not use_cache or provider not in DEFAULT_MODELS:
+            return await self._chat(prompt, provider, model, system_prompt, api_key)
+        effective_key = api_key or getattr(self, f"{provider}_key", "")
+        key = self.cache.key(provider, model or DEFAULT_MODELS[provider], system_prompt, prompt, effective_key)
+        return await self.cache.get_or_compute(
+            key, lambda: self._chat(prompt, provider, model, system_prompt, api_key)
+        )
+
+    async def _chat(self, prompt, provider, model, system_prompt, api_key) -> dict:
+        if provider not in DEFAULT_MODELS:
+            return {"error": f"Unknown provider: {provider}"}
+        start = time.perf_counter()
         try:
             # Use provided key or fallback to env var
             key = api_key or getattr(self, f"{provider}_key", "")
-            
+
             if provider == "anthropic":
-                return await self._anthropic_chat(prompt, model, system_prompt, key)
+                result = await self._anthropic_chat(prompt, model, system_prompt, key)
             elif provider == "openai":
-                return await self._openai_chat(prompt, model, system_prompt, key)
-            elif provider == "deepseek":
-                return await self._deepseek_chat(prompt, model, system_prompt, key)
+                result = await self._openai_chat(prompt, model, system_prompt, key)
             else:
-                return {"error": f"Unknown provider: {provider}"}
+                result = await self._deepseek_chat(prompt, model, system_prompt, key)
+        except Exception as e:
+            result = {"error": str(e)}
+        _observe(provider, model or DEFAULT_MODELS[provider], start, result)
+        return result
+
+    async def chat_stream(
+        self,
+        prompt: str,
+        provider: str = "anthropic",
+        model: Optional[str] = None,
+        system_prompt: str = "You are a helpful assistant.",
+        api_key: Optional[str] = None,
+    ):
+        """Yield ``delta`` events as tokens arrive, then one ``done`` (or ``error``) event.
+
+        Closing the generator (e.g. on client disconnect) closes the upstream stream.
+        """
+        key = api_key or getattr(self, f"{provider}_key", "")
+        if provider == "anthropic":
+            events = self._anthropic_stream(prompt, model, system_prompt, key)
+        elif provider == "openai":
+            events = self._openai_stream("openai", None, model or DEFAULT_MODELS["openai"], prompt, system_prompt, key)
+        elif provider == "deepseek":
+            events = self._openai_stream("deepseek", DEEPSEEK_BASE_URL, model or DEFAULT_MODELS["deepseek"], prompt, system_prompt, key)
+        else:
+            yield {"type": "error", "error": f"Unknown provider: {provider}"}
+            return
+
+        start = time.perf_counter()
+        first_token_at = None
+        try:
+            async for event in events:
+                if event["type"] == "delta" and first_token_at is None:
+                    first_token_at = time.perf_counter()
+                if event["type"] == "done":
+                    event["ttft_ms"] = round((first_token_at - start) * 1000, 3) if first_token_at else None
+                    event["total_ms"] = round((time.perf_counter() - start) * 1000, 3)
+                    _observe(provider, model or DEFAULT_MODELS[provider], start, event)
+                yield event
         except Exception as e:
-            return {"error": str(e)}
+            _observe(provider, model or DEFAULT_MODELS[provider], start, {"error": str(e)})
+            yield {"type": "error", "error": str(e)}
+        finally:
+            await events.aclose()
+
+    async def _anthropic_stream(self, prompt, model, system_prompt, api_key):
+        async with self._client("anthropic", api_key) as client:
+            async with client.messages.stream(
+                model=model or DEFAULT_MODELS["anthropic"],
+                max_tokens=2048,
+                system=system_prompt,
+                messages=[{"role": "user", "content": prompt}],
+            ) as stream:
+                async for text in stream.text_stream:
+                    yield {"type": "delta", "text": text}
+                message = await stream.get_final_message()
+        yield {
+            "type": "done",
+            "model": message.model,
+            "usage": {
+                "input_tokens": message.usage.input_tokens,
+                "output_tokens": message.usage.output_tokens,
+            },
+        }
+
+    async def _openai_stream(self, provider, base_url, model, prompt, system_prompt, api_key):
+        # Shared by OpenAI and the OpenAI-compatible DeepSeek API
+        usage, model_name = None, model
+        async with self._client(provider, api_key, base_url) as client:
+            stream = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt},
+                ],
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            try:
+                async for chunk in stream:
+                    model_name = chunk.model or model_name
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield {"type": "delta", "text": chunk.choices[0].delta.content}
+            finally:
+                await stream.close()
+        yield {
+            "type": "done",
+            "model": model_name,
+            "usage": {
+                "input_tokens": usage.prompt_tokens if usage else None,
+                "output_tokens": usage.completion_tokens if usage else None,
+            },
+        }
 
     async def _anthropic_chat(self, prompt, model, system_prompt, api_key):
-        from anthropic import Anthropic
-
-        client = Anthropic(api_key=api_key)
-        message = client.messages.create(
-            model=model or "claude-sonnet-4-20250514",
-            max_tokens=2048,
-            system=system_prompt,
-            messages=[{"role": "user", "content": prompt}],
-        )
+        async with self._client("anthropic", api_key) as client:
+            message = await client.messages.create(
+                model=model or DEFAULT_MODELS["anthropic"],
+                max_tokens=2048,
+                system=system_prompt,
+                messages=[{"role": "user", "content": prompt}],
+            )
         return {
             "response": message.content[0].text,
             "model": message.model,
@@ -51,16 +282,14 @@ class AiService:
         }
 
     async def _openai_chat(self, prompt, model, system_prompt, api_key):
-        from openai import OpenAI
-
-        client = OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
-            model=model or "gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt},
-            ],
-        )
+        async with self._client("openai", api_key) as client:
+            response = await client.chat.completions.create(
+                model=model or DEFAULT_MODELS["openai"],
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt},
+                ],
+            )
         return {
             "response": response.choices[0].message.content,
             "model": response.model,
@@ -71,20 +300,15 @@ class AiService:
         }
 
     async def _deepseek_chat(self, prompt, model, system_prompt, api_key):
-        from openai import OpenAI
-
         # DeepSeek uses OpenAI-compatible API
-        client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.deepseek.com"
-        )
-        response = client.chat.completions.create(
-            model=model or "deepseek-chat",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt},
-            ],
-        )
+        async with self._client("deepseek", api_key, DEEPSEEK_BASE_URL) as client:
+            response = await client.chat.completions.create(
+                model=model or DEFAULT_MODELS["deepseek"],
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt},
+                ],
+            )
         return {
             "response": response.choices[0].message.content,
             "model": response.model,
@@ -92,4 +316,4 @@ class AiService:
                 "input_tokens": response.usage.prompt_tokens,
                 "output_tokens": response.usage.completion_tokens,
             },
-        }
\ No newline at end of file
+        }
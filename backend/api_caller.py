@@ -1,8 +1,194 @@
-import httpx
+import asyncio
+import base64
+import codecs
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
 from typing import Optional
 
+import httpx
+
+from backend.http_cache import CACHEABLE_METHODS, HttpResponseCache
+from backend.metrics import api_call_duration, api_calls_total
+
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "30"))
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "100"))
+API_MAX_KEEPALIVE = int(os.getenv("API_MAX_KEEPALIVE", "20"))
+API_MAX_CONNECTIONS_PER_HOST = int(os.getenv("API_MAX_CONNECTIONS_PER_HOST", "10"))
+API_KEEPALIVE_EXPIRY = float(os.getenv("API_KEEPALIVE_EXPIRY", "30"))
+API_HTTP2 = os.getenv("API_HTTP2", "false").lower() in ("1", "true", "yes")
+API_BATCH_CONCURRENCY = int(os.getenv("API_BATCH_CONCURRENCY", "20"))
+# Opt-in response cache (per request); 0 disables it entirely
+API_CACHE_MAX_BYTES = int(os.getenv("API_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+API_CACHE_DEFAULT_TTL = float(os.getenv("API_CACHE_DEFAULT_TTL", "60"))
+# Upstream bodies beyond these sizes are cut off and flagged as truncated
+API_MAX_RESPONSE_BYTES = int(os.getenv("API_MAX_RESPONSE_BYTES", str(10 * 1024 * 1024)))
+API_STREAM_MAX_BYTES = int(os.getenv("API_STREAM_MAX_BYTES", str(256 * 1024 * 1024)))
+API_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _is_textual(content_type: str) -> bool:
+    content_type = (content_type or "").lower()
+    return (
+        content_type.startswith("text/")
+        or "json" in content_type
+        or "xml" in content_type
+        or "javascript" in content_type
+        or "charset=" in content_type
+    )
+
+
+def _decode_body(body: bytes, content_type: str, encoding: str):
+    """JSON only when the response looks like JSON, otherwise text."""
+    text = body.decode(encoding or "utf-8", errors="replace")
+    if "json" in (content_type or "").lower() or text.lstrip()[:1] in ("{", "["):
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass
+    return text
+
+
+class RequestTimer:
+    """Per-request timing collected from httpcore trace events.
+
+    httpcore resolves DNS inside its TCP connect step, so ``connect_ms``
+    includes name resolution. Connection fields are None when the request
+    reused a pooled connection.
+    """
+
+    def __init__(self, on_event=None):
+        self._on_event = on_event
+        self._marks = {}
+        self.start = time.perf_counter()
+        self.end = None
+        self.bytes_received = 0
+
+    async def trace(self, event_name: str, info: dict):
+        self._marks.setdefault(event_name, time.perf_counter())
+        if self._on_event is not None:
+            await self._on_event(event_name, info)
+
+    def _span(self, started: str, complete: str):
+        if started in self._marks and complete in self._marks:
+            return round((self._marks[complete] - self._marks[started]) * 1000, 3)
+        return None
+
+    def finish(self, bytes_received: int):
+        self.end = time.perf_counter()
+        self.bytes_received = bytes_received
+
+    def to_dict(self) -> dict:
+        headers_done = next(
+            (self._marks[e] for e in ("http11.receive_response_headers.complete",
+                                      "http2.receive_response_headers.complete") if e in self._marks),
+            None,
+        )
+        end = self.end or time.perf_counter()
+        return {
+            "reused_connection": "connection.connect_tcp.started" not in self._marks,
+            "connect_ms": self._span("connection.connect_tcp.started", "connection.connect_tcp.complete"),
+            "tls_ms": self._span("connection.start_tls.started", "connection.start_tls.complete"),
+            "ttfb_ms": round((headers_done - self.start) * 1000, 3) if headers_done else None,
+            "total_ms": round((end - self.start) * 1000, 3),
+            "bytes_received": self.bytes_received,
+        }
+
 
 class ApiCaller:
+    """Relays /call-api requests through one long-lived, pooled httpx client.
+
+    The client is created by ``start()`` (called from the app lifespan) and
+    shared by every call, so repeated requests to a host reuse keep-alive
+    connections instead of paying DNS + TCP + TLS each time.
+    """
+
+    def __init__(
+        self,
+        timeout: float = API_TIMEOUT,
+        max_connections: int = API_MAX_CONNECTIONS,
+        max_keepalive_connections: int = API_MAX_KEEPALIVE,
+        max_connections_per_host: int = API_MAX_CONNECTIONS_PER_HOST,
+        keepalive_expiry: float = API_KEEPALIVE_EXPIRY,
+        http2: bool = API_HTTP2,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        cache_max_bytes: int = API_CACHE_MAX_BYTES,
+        cache_default_ttl: float = API_CACHE_DEFAULT_TTL,
+        max_response_bytes: int = API_MAX_RESPONSE_BYTES,
+    ):
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.max_connections_per_host = max_connections_per_host
+        self.max_response_bytes = max_response_bytes
+        if http2 and not _http2_available():
+            print("API_HTTP2 requested but the h2 package is not installed; using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self._transport = transport
+        self.cache = HttpResponseCache(cache_max_bytes, cache_default_ttl) if cache_max_bytes > 0 else None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots = {}
+        self._host_users = defaultdict(int)
+        self._in_flight = defaultdict(int)
+        self._requests = 0
+        self._new_connections = 0
+        self._errors = 0
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+                transport=self._transport,
+            )
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        # Scripts that never ran the app lifespan still get a pooled client
+        if self._client is None:
+            await self.start()
+        return self._client
+
+    @asynccontextmanager
+    async def _host_slot(self, host: str):
+        """Hold one of the host's connection slots."""
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.max_connections_per_host)
+        self._host_users[host] += 1
+        try:
+            async with slot:
+                yield
+        finally:
+            self._host_users[host] -= 1
+            if not self._host_users[host]:
+                # URLs are user-supplied: drop a host once nobody holds or awaits its slots
+                del self._host_users[host]
+                del self._host_slots[host]
+
+    async def _trace(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.started":
+            self._new_connections += 1
+
     async def call(
         self,
         url: str,
@@ -10,28 +196,214 @@ class ApiCaller:
         headers: Optional[dict] = None,
         body: Optional[dict] = None,
         params: Optional[dict] = None,
+        cache: bool = False,
     ) -> dict:
+        method = method.upper()
+        headers = headers or {}
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.request(
-                    method=method.upper(),
+            use_cache = cache and self.cache is not None and method in CACHEABLE_METHODS and body is None
+            cached = None
+            if use_cache:
+                key = self.cache.key(method, url, params, headers)
+                cached, fresh = self.cache.lookup(key, headers)
+                if cached and fresh:
+                    return cached.to_result("hit")
+                if cached:
+                    headers = {**headers, **self.cache.conditional_headers(cached)}
+
+            timer = RequestTimer(self._trace)
+            async with self._open(method, url, headers, body, params, timer) as response:
+                response_headers = dict(response.headers)
+                if cached and response.status_code == 304:
+                    timer.finish(0)
+                    result = self.cache.refresh(key, cached, response_headers).to_result("revalidated")
+                    result["timing"] = timer.to_dict()
+                    return result
+
+                chunks, size, truncated = [], 0, False
+                async for chunk in response.aiter_bytes():
+                    if size + len(chunk) > self.max_response_bytes:
+                        chunks.append(chunk[: self.max_response_bytes - size])
+                        size = self.max_response_bytes
+                        truncated = True
+                        break
+                    chunks.append(chunk)
+                    size += len(chunk)
+                timer.finish(size)
+                content_type = response.headers.get("content-type", "")
+                body_bytes = b"".join(chunks)
+                # A cut-off body would not parse; hand back what arrived as text
+                if truncated:
+                    data = body_bytes.decode(response.encoding or "utf-8", errors="replace")
+                else:
+                    data = _decode_body(body_bytes, content_type, response.encoding)
+
+            result = {
+                "status": response.status_code,
+                "data": data,
+                "headers": response_headers,
+                "http_version": response.http_version,
+                "size": size,
+                "truncated": truncated,
+                "timing": timer.to_dict(),
+            }
+            if use_cache and not truncated:
+                self.cache.store(
+                    key, response.status_code, data, response_headers,
+                    response.http_version, size, headers,
+                )
+            if use_cache:
+                result["cache"] = "miss"
+            return result
+        except httpx.TimeoutException:
+            self._errors += 1
+            return {"status": 0, "error": "Request timed out"}
+        except Exception as e:
+            self._errors += 1
+            return {"status": 0, "error": str(e)}
+
+    @asynccontextmanager
+    async def _open(self, method, url, headers, body, params, timer: RequestTimer):
+        """Send a request and yield the response with its body still unread."""
+        client = await self._get_client()
+        host = httpx.URL(url).host
+        async with self._host_slot(host):
+            self._requests += 1
+            self._in_flight[host] += 1
+            start, status = time.perf_counter(), 0
+            try:
+                request = client.build_request(
+                    method=method,
                     url=url,
-                    headers=headers or {},
+                    headers=headers,
                     json=body,
                     params=params,
+                    extensions={"trace": timer.trace},
                 )
-                # Try to parse as JSON, fallback to text
+                response = await client.send(request, stream=True)
+                status = response.status_code
                 try:
-                    data = response.json()
-                except Exception:
-                    data = response.text
+                    yield response
+                finally:
+                    await response.aclose()
+            finally:
+                self._in_flight[host] -= 1
+                if not self._in_flight[host]:
+                    del self._in_flight[host]
+                # Until the body was read or abandoned; status 0 means no response arrived
+                api_calls_total.labels(host, str(status)).inc()
+                api_call_duration.labels(host).observe(time.perf_counter() - start)
 
-                return {
+    async def stream(
+        self,
+        url: str,
+        method: str = "GET",
+        headers: Optional[dict] = None,
+        body: Optional[dict] = None,
+        params: Optional[dict] = None,
+        max_bytes: int = API_STREAM_MAX_BYTES,
+    ):
+        """Relay an upstream response as a sequence of frames without buffering it.
+
+        Yields ``meta`` (status and headers), then ``chunk`` frames (text, or
+        base64 for binary content types), and finally ``end`` with the byte
+        count, the truncation flag and the timing breakdown.
+        """
+        timer = RequestTimer(self._trace)
+        size, truncated = 0, False
+        try:
+            async with self._open(method.upper(), url, headers or {}, body, params, timer) as response:
+                content_type = response.headers.get("content-type", "")
+                yield {
+                    "type": "meta",
                     "status": response.status_code,
-                    "data": data,
                     "headers": dict(response.headers),
+                    "http_version": response.http_version,
                 }
+                decoder = None
+                if _is_textual(content_type):
+                    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+                async for chunk in response.aiter_bytes(API_STREAM_CHUNK_SIZE):
+                    if size + len(chunk) > max_bytes:
+                        chunk = chunk[: max_bytes - size]
+                        truncated = True
+                    size += len(chunk)
+                    if decoder is not None:
+                        yield {"type": "chunk", "data": decoder.decode(chunk)}
+                    else:
+                        yield {"type": "chunk", "data": base64.b64encode(chunk).decode("ascii"), "encoding": "base64"}
+                    if truncated:
+                        break
+                if decoder is not None:
+                    # Bytes of a character split across the last chunk boundary
+                    tail = decoder.decode(b"", final=True)
+                    if tail:
+                        yield {"type": "chunk", "data": tail}
         except httpx.TimeoutException:
-            return {"status": 0, "error": "Request timed out"}
+            self._errors += 1
+            yield {"type": "error", "error": "Request timed out"}
         except Exception as e:
-            return {"status": 0, "error": str(e)}
\ No newline at end of file
+            self._errors += 1
+            yield {"type": "error", "error": str(e)}
+        timer.finish(size)
+        yield {"type": "end", "bytes": size, "truncated": truncated, "timing": timer.to_dict()}
+
+    async def call_many(
+        self,
+        requests: list,
+        concurrency: int = API_BATCH_CONCURRENCY,
+        item_timeout: Optional[float] = None,
+    ):
+        """Run many calls concurrently, yielding each result as soon as it finishes.
+
+        ``requests`` is a list of ``call()`` keyword dicts. Every result carries
+        its ``index`` in the input list; a slow or failing item only affects
+        its own result. Per-host limits from ``call()`` still apply.
+        """
+        slots = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(index: int, request: dict) -> dict:
+            async with slots:
+                start = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(self.call(**request), item_timeout)
+                except asyncio.TimeoutError:
+                    result = {"status": 0, "error": f"Request timed out after {item_timeout}s"}
+                result["index"] = index
+                result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+                return result
+
+        tasks = [asyncio.create_task(run(i, r)) for i, r in enumerate(requests)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # The consumer went away (e.g. client disconnect): drop the rest
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        connections = []
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        for conn in getattr(pool, "connections", []):
+            origin = getattr(conn, "_origin", None)
+            connections.append({
+                "host": origin.host.decode("ascii") if origin else None,
+                "idle": conn.is_idle(),
+            })
+        return {
+            "started": self._client is not None,
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "max_connections_per_host": self.max_connections_per_host,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "requests_total": self._requests,
+            "new_connections_total": self._new_connections,
+            "errors_total": self._errors,
+            "in_flight": dict(self._in_flight),
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c["idle"]),
+            "connections": connections,
+            "cache": self.cache.stats() if self.cache else None,
+        }
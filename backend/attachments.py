@@ -0,0 +1,170 @@
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+from backend.database import db_cursor
+
+ATTACHMENTS_DIR = os.getenv("ATTACHMENTS_DIR", os.path.join("data", "attachments"))
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(20 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+_DATA_URL_RE = re.compile(r"^data:([\w.+-]+/[\w.+-]+)?(;[^,]*)?;base64,(.*)$", re.DOTALL)
+
+
+# Raster formats only: SVG can carry script, so it is not served as an image
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+IMAGE_TYPES = frozenset(t for _, t in IMAGE_SIGNATURES) | {"image/webp"}
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+class UnsupportedAttachment(ValueError):
+    pass
+
+
+def sniff_image(head: bytes):
+    """Image content type from a file's leading bytes, or None if it is not a supported image."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+class AttachmentStore:
+    """Content-addressed blob store on the local filesystem.
+
+    Blobs live at ``<root>/<sha[:2]>/<sha>`` and are keyed by their SHA-256,
+    so identical uploads are stored once and a stored file never changes.
+    Metadata (content type, size) is kept in the ``attachments`` table.
+    """
+
+    def __init__(self, root: str = ATTACHMENTS_DIR, max_bytes: int = ATTACHMENT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def is_valid_id(attachment_id: str) -> bool:
+        return bool(_ID_RE.match(attachment_id))
+
+    def path_for(self, attachment_id: str) -> str:
+        return os.path.join(self.root, attachment_id[:2], attachment_id)
+
+    def open_writer(self) -> "AttachmentWriter":
+        os.makedirs(self.root, exist_ok=True)
+        return AttachmentWriter(self)
+
+    def save_bytes(self, data: bytes, content_type: str) -> str:
+        with self.open_writer() as writer:
+            writer.write(data)
+            return writer.commit(content_type)
+
+    def get_metadata(self, attachment_id: str):
+        with db_cursor() as cur:
+            cur.execute("SELECT * FROM attachments WHERE id = %s", (attachment_id,))
+            row = cur.fetchone()
+            return dict(row) if row else None
+
+
+class AttachmentWriter:
+    """Incrementally hashes and spools one upload, then moves it into place."""
+
+    def __init__(self, store: AttachmentStore):
+        self.store = store
+        self.size = 0
+        self.head = b""
+        self._hash = hashlib.sha256()
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.root, suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.store.max_bytes:
+            raise AttachmentTooLarge(f"Attachment exceeds {self.store.max_bytes} bytes")
+        if len(self.head) < 16:
+            self.head = (self.head + chunk)[:16]
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    @property
+    def image_type(self):
+        return sniff_image(self.head)
+
+    def commit(self, content_type: str) -> str:
+        self._file.close()
+        attachment_id = self._hash.hexdigest()
+        path = self.store.path_for(attachment_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.unlink(self._tmp_path)
+        else:
+            os.replace(self._tmp_path, path)
+        with db_cursor() as cur:
+            cur.execute(
+                "INSERT INTO attachments (id, content_type, size) VALUES (%s, %s, %s) ON CONFLICT (id) DO NOTHING",
+                (attachment_id, content_type or "application/octet-stream", self.size),
+            )
+        return attachment_id
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+
+
+def migrate_note_images(cursor, store: AttachmentStore, batch_size: int = 100) -> int:
+    """Move base64 data URLs out of notes.images into the attachment store.
+
+    Runs once as a schema migration, on the migration's cursor. Entries that
+    are not valid base64 are left as they are. Returns the number of notes rewritten.
+    """
+    migrated = 0
+    last_id = 0
+    while True:
+        cursor.execute(
+            "SELECT id, images FROM notes WHERE id > %s AND images LIKE %s ORDER BY id LIMIT %s",
+            (last_id, "%data:%", batch_size),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return migrated
+        for row in rows:
+            last_id = row["id"]
+            try:
+                images = json.loads(row["images"])
+            except ValueError:
+                continue
+            refs = []
+            for image in images:
+                match = _DATA_URL_RE.match(image) if isinstance(image, str) else None
+                if not match:
+                    refs.append(image)
+                    continue
+                try:
+                    data = base64.b64decode(match.group(3), validate=False)
+                except (binascii.Error, ValueError):
+                    data = b""
+                if not data:
+                    refs.append(image)
+                    continue
+                refs.append(store.save_bytes(data, sniff_image(data[:16]) or "application/octet-stream"))
+            cursor.execute("UPDATE notes SET images = %s WHERE id = %s", (json.dumps(refs), row["id"]))
+            migrated += 1
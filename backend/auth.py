@@ -0,0 +1,88 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+import jwt
+
+from backend.cache import LRUCache
+
+# bcrypt cost factor for new hashes; stored hashes with another cost are rehashed on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, so these threads hash in parallel without blocking the event loop
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "4096"))
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "300"))
+
+
+class PasswordHasher:
+    """bcrypt on a small dedicated thread pool instead of the event loop."""
+
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, workers: int = AUTH_HASH_WORKERS):
+        self.rounds = rounds
+        self.workers = workers
+        self._executor = None
+
+    def _run(self, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run(bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(self.rounds))
+        return hashed.decode("utf-8")
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        # $2b$<cost>$<salt+hash>
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class TokenCache:
+    """Usernames of recently verified JWTs, so repeat requests skip decoding.
+
+    An entry lives for ``ttl`` seconds at most and never past the token's
+    own ``exp``. Not thread-safe; use from the event loop.
+    """
+
+    def __init__(self, max_entries: int = AUTH_TOKEN_CACHE_SIZE, ttl: float = AUTH_TOKEN_CACHE_TTL):
+        self.ttl = ttl
+        # One "byte" per entry: the LRU is bounded by entry count here
+        self._lru = LRUCache(max_entries, max_entries)
+
+    def get(self, token: str):
+        entry = self._lru.get(token)
+        return entry.value if entry is not None else None
+
+    def set(self, token: str, username: str, exp):
+        ttl = self.ttl
+        if exp is not None:
+            ttl = min(ttl, float(exp) - time.time())
+        if ttl > 0:
+            self._lru.set(token, username, 1, ttl)
+
+    def decode(self, token: str, secret: str, algorithms: list):
+        """Return the token's ``sub``; raises jwt.PyJWTError for invalid or expired tokens."""
+        username = self.get(token)
+        if username is not None:
+            return username
+        payload = jwt.decode(token, secret, algorithms=algorithms)
+        username = payload.get("sub")
+        if username is None:
+            raise jwt.InvalidTokenError("Token has no subject")
+        self.set(token, username, payload.get("exp"))
+        return username
+
+    def stats(self) -> dict:
+        return {**self._lru.stats(), "ttl_s": self.ttl}
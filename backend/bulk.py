@@ -0,0 +1,82 @@
+"""CSV and NDJSON reading and writing for the bulk import/export endpoints."""
+import csv
+import io
+import json
+import os
+
+FORMATS = ("csv", "ndjson")
+# Rows per multi-row INSERT during import, and per server-side cursor fetch during export
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# Exports run on their own connections, outside the pool; this caps how many are open at once
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", "4"))
+# Per-row errors listed in an import response; the count covers all of them
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+
+_EXTENSIONS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+_CONTENT_TYPES = {"text/csv": "csv", "application/x-ndjson": "ndjson", "application/jsonl": "ndjson"}
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+class InvalidUpload(ValueError):
+    """The file as a whole cannot be read (unknown format, bad encoding, no CSV header)."""
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def detect_format(explicit: str = None, filename: str = None, content_type: str = None) -> str:
+    if explicit:
+        if explicit not in FORMATS:
+            raise InvalidUpload(f"Unsupported format {explicit!r}, expected one of {', '.join(FORMATS)}")
+        return explicit
+    extension = os.path.splitext(filename or "")[1].lower()
+    fmt = _EXTENSIONS.get(extension) or _CONTENT_TYPES.get((content_type or "").split(";")[0].strip())
+    if fmt is None:
+        raise InvalidUpload("Cannot tell the file format; pass format=csv or format=ndjson")
+    return fmt
+
+
+def read_records(fileobj, fmt: str):
+    """Yield ``(line, record)`` per row; ``record`` is a dict or an InvalidRecord.
+
+    Reads the binary ``fileobj`` incrementally, so the file is never fully
+    in memory. CSV needs a header row; empty cells count as missing so
+    model defaults apply.
+    """
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            reader = csv.DictReader(text)
+            if reader.fieldnames is None:
+                raise InvalidUpload("CSV file has no header row")
+            for row in reader:
+                yield reader.line_num, {k: v for k, v in row.items() if k is not None and v not in (None, "")}
+        else:
+            for line, raw in enumerate(text, start=1):
+                if not raw.strip():
+                    continue
+                try:
+                    record = json.loads(raw)
+                except ValueError as e:
+                    yield line, InvalidRecord(f"Invalid JSON: {e}")
+                    continue
+                yield line, record if isinstance(record, dict) else InvalidRecord("Expected a JSON object")
+    except UnicodeDecodeError as e:
+        raise InvalidUpload(f"File is not valid UTF-8: {e}")
+    finally:
+        # Hand the underlying file back open; its owner closes it
+        text.detach()
+
+
+def format_rows(rows: list, columns: tuple, fmt: str, header: bool = False) -> str:
+    """One export chunk: rows as NDJSON lines, or CSV (with the header row first if asked)."""
+    if fmt == "ndjson":
+        return "".join(json.dumps(row, default=str) + "\n" for row in rows)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    if header:
+        writer.writerow(columns)
+    writer.writerows([row.get(c) for c in columns] for row in rows)
+    return out.getvalue()
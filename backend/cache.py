@@ -0,0 +1,85 @@
+import time
+from collections import OrderedDict
+
+
+class CacheEntry:
+    __slots__ = ("value", "size", "expires_at")
+
+    def __init__(self, value, size: int, expires_at: float):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+    def is_fresh(self, now: float = None) -> bool:
+        return (now or time.monotonic()) < self.expires_at
+
+
+class LRUCache:
+    """In-memory LRU bounded by total byte size, with per-entry TTL.
+
+    Values are stored as-is and handed back by reference, so callers must
+    treat them as immutable. Expired entries are kept until evicted and can
+    be fetched with ``allow_stale=True`` (e.g. for HTTP revalidation).
+    Not thread-safe; use from a single event loop.
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, allow_stale: bool = False):
+        entry = self._entries.get(key)
+        if entry is None or (not allow_stale and not entry.is_fresh()):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def set(self, key, value, size: int, ttl: float):
+        if size > self.max_bytes:
+            return None
+        self.pop(key)
+        entry = CacheEntry(value, size, time.monotonic() + ttl)
+        self._entries[key] = entry
+        self._bytes += size
+        while self._bytes > self.max_bytes or (self.max_entries and len(self._entries) > self.max_entries):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+        return entry
+
+    def touch(self, key, ttl: float):
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.expires_at = time.monotonic() + ttl
+            self._entries.move_to_end(key)
+        return entry
+
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
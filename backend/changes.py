@@ -0,0 +1,156 @@
+"""Live change feed: Postgres LISTEN/NOTIFY fanned out to in-process subscribers.
+
+Writes to the resource tables append to ``change_log`` and NOTIFY
+CHANGES_CHANNEL in the same transaction (see
+repository.TableRepository._log_changes). Each backend worker keeps one
+dedicated LISTEN connection on a thread; a notification only wakes the
+dispatcher, which reads what is new from change_log (numbering newly
+committed entries first) and hands it to every subscriber queue. Reading from the table rather than the payload means a
+dropped listener connection loses nothing: it catches up on reconnect,
+and a slow poll covers notifications that never arrive.
+"""
+import asyncio
+import os
+import select
+import threading
+import time
+
+import psycopg2
+
+from backend import repository
+from backend.database import DATABASE_URL
+
+CHANGES_POLL_INTERVAL = float(os.getenv("CHANGES_POLL_INTERVAL", "5"))
+# Change events buffered per subscriber; one that falls further behind is told to reload
+CHANGES_SUBSCRIBER_QUEUE = int(os.getenv("CHANGES_SUBSCRIBER_QUEUE", "1000"))
+# change_log entries older than this are purged (clients further behind get a reset)
+CHANGES_RETENTION = float(os.getenv("CHANGES_RETENTION", str(7 * 24 * 3600)))
+PURGE_EVERY = 3600
+
+
+class ChangeFeed:
+    def __init__(self, dsn: str = DATABASE_URL, poll_interval: float = CHANGES_POLL_INTERVAL,
+                 queue_size: int = CHANGES_SUBSCRIBER_QUEUE, retention: float = CHANGES_RETENTION):
+        self.dsn = dsn
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.retention = retention
+        self.version = 0
+        self._subscribers = set()
+        self._loop = None
+        self._wake = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._task = None
+        self.listening = False
+        self.notifications = 0
+        self.reconnects = 0
+        self.dispatched = 0
+        self.overflowed = 0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self.version = await repository.changes.latest()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, name="change-listener", daemon=True)
+        self._thread.start()
+        self._task = asyncio.create_task(self._dispatch())
+
+    async def aclose(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, 5)
+            self._thread = None
+
+    def _listen(self):
+        backoff = 1
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {repository.CHANGES_CHANNEL}")
+                self.listening = True
+                backoff = 1
+                # Anything committed while we were not listening
+                self._notify()
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        if conn.notifies:
+                            self.notifications += len(conn.notifies)
+                            conn.notifies.clear()
+                            self._notify()
+            except (psycopg2.Error, OSError) as e:
+                self.reconnects += 1
+                print(f"Change feed listener lost its connection, retrying in {backoff}s: {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                self.listening = False
+                if conn is not None:
+                    conn.close()
+
+    def _notify(self):
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _dispatch(self):
+        last_purge = 0.0
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                while True:
+                    page = await repository.changes.since(self.version)
+                    for change in page["changes"]:
+                        self._publish(change)
+                    self.version = page["version"]
+                    if not page["more"]:
+                        break
+                if time.monotonic() - last_purge > PURGE_EVERY:
+                    await repository.changes.purge(self.retention)
+                    last_purge = time.monotonic()
+            except Exception as e:
+                print(f"Change feed dispatch failed: {e}")
+
+    def _publish(self, change: dict):
+        self.dispatched += 1
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(change)
+            except asyncio.QueueFull:
+                # Too far behind: drop what it has and leave only the reset marker
+                self.overflowed += 1
+                self._subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue of change dicts from now on; a None item means events were lost and the client must reload."""
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "listening": self.listening,
+            "subscribers": len(self._subscribers),
+            "notifications_total": self.notifications,
+            "dispatched_total": self.dispatched,
+            "overflowed_total": self.overflowed,
+            "reconnects_total": self.reconnects,
+        }
@@ -1,39 +1,417 @@
-import subprocess
+import asyncio
+import codecs
+import json
+import os
+import signal
 import sys
 import tempfile
-import os
+import time
+from contextlib import asynccontextmanager
+
+from backend.code_worker import CODE_RUNNER_LIMIT_CPU, apply_limits, resource, sandbox_ids, signal_name
+
+# Warm interpreters kept ready for /run-code; 0 (or no os.fork) means a cold process per run
+CODE_RUNNER_WORKERS = int(os.getenv("CODE_RUNNER_WORKERS", "4"))
+CODE_RUNNER_MAX_RUNS = int(os.getenv("CODE_RUNNER_MAX_RUNS", "100"))
+CODE_RUNNER_PRELOAD = os.getenv(
+    "CODE_RUNNER_PRELOAD",
+    "json,math,re,datetime,collections,itertools,functools,random,statistics",
+)
+CODE_RUNNER_START_TIMEOUT = float(os.getenv("CODE_RUNNER_START_TIMEOUT", "10"))
+# Per stream (stdout/stderr); a run that prints more is stopped and marked truncated
+CODE_RUNNER_MAX_OUTPUT_BYTES = int(os.getenv("CODE_RUNNER_MAX_OUTPUT_BYTES", str(1024 * 1024)))
+READ_CHUNK_SIZE = 64 * 1024
+WORKER_STOP_TIMEOUT = 1.0
+
+
+class WorkerError(Exception):
+    """The worker broke the protocol or died; it is discarded and replaced."""
+
+
+class _Worker:
+    __slots__ = ("proc", "control", "control_transport", "runs", "retired")
+
+    def __init__(self, proc, control, control_transport):
+        self.proc = proc
+        # Worker-only channel for ready, each run's marker and its result line
+        self.control = control
+        self.control_transport = control_transport
+        self.runs = 0
+        # Set when a run left something behind; the worker is replaced instead of reused
+        self.retired = False
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.returncode is None
+
+    async def kill(self):
+        # SIGTERM first: the worker kills the running snippet's process group, which it
+        # cannot be reached through, then exits. SIGKILL takes anything left in its own group.
+        if self.proc.returncode is None:
+            try:
+                self.proc.send_signal(signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            deadline = time.monotonic() + WORKER_STOP_TIMEOUT
+            while self.proc.returncode is None and time.monotonic() < deadline:
+                await asyncio.sleep(0.005)
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await _reap(self.proc)
+        self.control_transport.close()
+
+
+class OutputLimitExceeded(Exception):
+    pass
+
+
+class _Output:
+    """One output stream of a run: kept up to ``limit`` bytes and forwarded as text as it arrives."""
+
+    def __init__(self, name: str, limit: int, on_output=None):
+        self.name = name
+        self.limit = limit
+        self.on_output = on_output
+        self.data = bytearray()
+        self.truncated = False
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def feed(self, chunk: bytes):
+        room = self.limit - len(self.data)
+        if len(chunk) > room:
+            chunk = chunk[:max(room, 0)]
+            self.truncated = True
+        self.data.extend(chunk)
+        if self.on_output is not None and chunk:
+            text = self._decoder.decode(chunk)
+            if text:
+                self.on_output(self.name, text)
+        if self.truncated:
+            raise OutputLimitExceeded(f"Output limit exceeded ({self.limit} bytes on {self.name})")
+
+    def text(self) -> str:
+        return self.data.decode("utf-8", errors="replace")
+
+
+async def _pump(stream, output: _Output, marker: bytes = None) -> bytes:
+    """Feed ``stream`` into ``output`` until EOF or ``marker``; return whatever followed the marker."""
+    held = b""  # tail that may be the start of a marker split across reads
+    while True:
+        chunk = await stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            if marker is not None:
+                raise WorkerError("worker exited mid-run")
+            output.feed(held)
+            return b""
+        data = held + chunk
+        if marker is not None:
+            index = data.find(marker)
+            if index != -1:
+                output.feed(data[:index])
+                return data[index + len(marker):]
+            # Markers are \x00<hex>\x00, so only a tail starting at the last NUL can be one
+            start = data.rfind(b"\x00", max(0, len(data) - len(marker) + 1))
+            if start != -1 and marker.startswith(data[start:]):
+                data, held = data[:start], data[start:]
+            else:
+                held = b""
+        output.feed(data)
+
+
+async def _control_line(worker: _Worker) -> bytes:
+    line = await worker.control.readline()
+    if not line.endswith(b"\n"):
+        raise WorkerError("worker exited mid-run")
+    return line[:-1]
+
+
+async def _collect(*pumps):
+    """Run the pumps for a process's streams; the first failure cancels the others."""
+    tasks = [asyncio.ensure_future(pump) for pump in pumps]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Let them unwind so nothing is still reading when the process gets reaped
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _reap(proc):
+    """Wait for a killed process. Unread output is drained first, since asyncio
+    does not report the exit until its pipes reach EOF."""
+    for stream in (proc.stdout, proc.stderr):
+        if stream is not None:
+            while await stream.read(READ_CHUNK_SIZE):
+                pass
+    await proc.wait()
+
+
+class WorkerPool:
+    """Pre-started interpreters that have already paid for startup and imports.
+
+    Each run is forked from an idle worker, so snippets stay isolated from
+    each other while skipping interpreter startup. A worker is recycled
+    after ``max_runs`` runs or when a run leaked a process, and killed and
+    replaced on a timeout or any protocol error. Other workers are not
+    affected.
+    """
+
+    def __init__(self, size: int = CODE_RUNNER_WORKERS, max_runs: int = CODE_RUNNER_MAX_RUNS,
+                 preload: str = CODE_RUNNER_PRELOAD):
+        self.size = size
+        self.max_runs = max_runs
+        self.preload = preload
+        self._slots = None
+        self._idle = []
+        self._spawning = set()
+        self._closed = False
+        self.spawned = 0
+        self.recycled = 0
+        self.killed = 0
+        self.runs = 0
+
+    async def start(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+            for _ in range(self.size):
+                self._replace()
+
+    async def _spawn(self) -> _Worker:
+        read_fd, write_fd = os.pipe()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "backend.code_worker",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                env={**os.environ, "CODE_RUNNER_PRELOAD": self.preload, "CODE_WORKER_CONTROL_FD": str(write_fd)},
+                start_new_session=True,
+                pass_fds=(write_fd,),
+            )
+        except Exception:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        control = asyncio.StreamReader()
+        transport, _ = await asyncio.get_running_loop().connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(control), os.fdopen(read_fd, "rb", 0)
+        )
+        worker = _Worker(proc, control, transport)
+        try:
+            line = await asyncio.wait_for(control.readline(), CODE_RUNNER_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            line = b""
+        if line != b"ready\n":
+            await worker.kill()
+            raise WorkerError("worker failed to start")
+        self.spawned += 1
+        return worker
+
+    async def _release(self, worker: _Worker):
+        if worker.alive and len(self._idle) < self.size and not self._closed:
+            self._idle.append(worker)
+        else:
+            await worker.kill()
+
+    def _replace(self):
+        """Warm up a worker in the background so the next run does not wait for one."""
+        async def spawn():
+            try:
+                worker = await self._spawn()
+            except (OSError, WorkerError):
+                # The next checkout will spawn inline and surface the error
+                return
+            await self._release(worker)
+
+        task = asyncio.create_task(spawn())
+        self._spawning.add(task)
+        task.add_done_callback(self._spawning.discard)
+
+    @asynccontextmanager
+    async def _checkout(self):
+        await self.start()
+        async with self._slots:
+            worker = self._idle.pop() if self._idle else await self._spawn()
+            healthy = False
+            try:
+                yield worker
+                healthy = worker.alive
+            finally:
+                if healthy and worker.runs < self.max_runs and not worker.retired:
+                    await self._release(worker)
+                else:
+                    if healthy:
+                        self.recycled += 1
+                    else:
+                        self.killed += 1
+                    await worker.kill()
+                    if not self._closed:
+                        self._replace()
+
+    async def run(self, code: str, timeout: float, on_output=None,
+                  max_output_bytes: int = CODE_RUNNER_MAX_OUTPUT_BYTES) -> dict:
+        stdout = _Output("stdout", max_output_bytes, on_output)
+        stderr = _Output("stderr", max_output_bytes, on_output)
+        async with self._checkout() as worker:
+            worker.runs += 1
+            self.runs += 1
+            start = time.perf_counter()
+            try:
+                usage = await asyncio.wait_for(self._exchange(worker, code, stdout, stderr), timeout)
+            except asyncio.TimeoutError:
+                await worker.kill()
+                return _result(False, stdout, stderr, f"Timeout ({timeout}s)", "timeout", _killed(start))
+            except OutputLimitExceeded as e:
+                await worker.kill()
+                return _result(False, stdout, stderr, str(e), "output_limit", _killed(start))
+            except (WorkerError, BrokenPipeError, ConnectionResetError, ValueError) as e:
+                await worker.kill()
+                return _result(False, stdout, stderr, f"Worker failed: {e}", "worker_error", _killed(start))
+            worker.retired = bool(usage.pop("leaked", 0))
+        return _result(usage["exit_code"] == 0, stdout, stderr, usage=usage)
+
+    async def _exchange(self, worker: _Worker, code: str, stdout: _Output, stderr: _Output) -> dict:
+        worker.proc.stdin.write(json.dumps({"code": code}).encode() + b"\n")
+        await worker.proc.stdin.drain()
+        # Picked by the worker after forking, so the snippet never sees it
+        marker = await _control_line(worker)
+        rests = await _collect(
+            _pump(worker.proc.stdout, stdout, marker),
+            _pump(worker.proc.stderr, stderr, marker),
+        )
+        # Output after the marker means something outlived the run; the protocol is out of sync
+        if any(rests):
+            raise WorkerError("unexpected worker output")
+        return json.loads(await _control_line(worker))
+
+    async def aclose(self):
+        self._closed = True
+        for task in list(self._spawning):
+            task.cancel()
+        while self._idle:
+            await self._idle.pop().kill()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "starting": len(self._spawning),
+            "max_runs": self.max_runs,
+            "runs_total": self.runs,
+            "spawned_total": self.spawned,
+            "recycled_total": self.recycled,
+            "killed_total": self.killed,
+        }
+
+
+def _killed(start: float) -> dict:
+    return {"signal": "SIGKILL", "wall_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+
+def _result(success: bool, stdout: _Output, stderr: _Output, error: str = None, reason: str = None,
+            usage: dict = None) -> dict:
+    """Run outcome plus accounting: wall time, CPU user/sys, peak RSS and exit code or signal."""
+    usage = usage or {}
+    if reason is None and usage.get("signal"):
+        cpu_ms = (usage.get("cpu_user_ms") or 0) + (usage.get("cpu_sys_ms") or 0)
+        # SIGXCPU is RLIMIT_CPU's soft limit; a SIGKILL once past it is the hard one
+        hit_cpu_limit = CODE_RUNNER_LIMIT_CPU > 0 and cpu_ms >= CODE_RUNNER_LIMIT_CPU * 1000
+        reason = "cpu_limit" if usage["signal"] == "SIGXCPU" or hit_cpu_limit else "signal"
+        error = error or f"Killed by {usage['signal']}"
+    err = stderr.text()
+    if error:
+        err = f"{err}\n{error}" if err else error
+    return {
+        "success": success,
+        "output": stdout.text(),
+        "error": err,
+        "truncated": stdout.truncated or stderr.truncated,
+        "reason": reason,
+        "exit_code": usage.get("exit_code"),
+        "signal": usage.get("signal"),
+        "wall_ms": usage.get("wall_ms"),
+        "cpu_user_ms": usage.get("cpu_user_ms"),
+        "cpu_sys_ms": usage.get("cpu_sys_ms"),
+        "peak_rss_kb": usage.get("peak_rss_kb"),
+    }
 
 
 class CodeRunner:
-    def __init__(self, timeout: int = 30):
+    def __init__(self, timeout: int = 30, workers: int = CODE_RUNNER_WORKERS):
         self.timeout = timeout
+        self.pool = WorkerPool(workers) if workers > 0 and hasattr(os, "fork") else None
+
+    async def start(self):
+        if self.pool is not None:
+            await self.pool.start()
 
-    def execute(self, code: str) -> dict:
-        """Execute Python code in a sandboxed subprocess."""
-        # Create temp file, close it, then write — avoids Windows file locking
+    async def aclose(self):
+        if self.pool is not None:
+            await self.pool.aclose()
+
+    async def run(self, code: str, timeout: int = None, on_output=None) -> dict:
+        """Run ``code``; ``on_output(stream, text)`` is called as stdout/stderr arrive."""
+        timeout = timeout or self.timeout
+        if self.pool is not None:
+            try:
+                return await self.pool.run(code, timeout, on_output)
+            except (OSError, WorkerError):
+                pass
+        return await self._run_cold(code, timeout, on_output)
+
+    async def _run_cold(self, code: str, timeout: int, on_output=None) -> dict:
+        """Fallback without the pool: a fresh interpreter, with the same streaming, output cap,
+        rlimits and user. CPU time and peak RSS are not reported, since asyncio reaps the process."""
+        stdout = _Output("stdout", CODE_RUNNER_MAX_OUTPUT_BYTES, on_output)
+        stderr = _Output("stderr", CODE_RUNNER_MAX_OUTPUT_BYTES, on_output)
         fd, filepath = tempfile.mkstemp(suffix=".py", text=True)
         try:
             with os.fdopen(fd, "w", encoding="utf-8") as f:
                 f.write(code)
-
-            result = subprocess.run(
-                [sys.executable, filepath],
-                capture_output=True,
-                text=True,
-                timeout=self.timeout,
+            ids = sandbox_ids()
+            user = {}
+            if ids is not None:
+                os.chown(filepath, *ids)
+                user = {"user": ids[0], "group": ids[1], "extra_groups": []}
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, filepath,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
                 cwd=tempfile.gettempdir(),
+                preexec_fn=apply_limits if resource is not None else None,
+                **user,
             )
-            return {
-                "success": result.returncode == 0,
-                "output": result.stdout,
-                "error": result.stderr,
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(_collect(_pump(proc.stdout, stdout), _pump(proc.stderr, stderr)), timeout)
+                await proc.wait()
+            except asyncio.TimeoutError:
+                return _result(False, stdout, stderr, f"Timeout ({timeout}s)", "timeout", _killed(start))
+            except OutputLimitExceeded as e:
+                return _result(False, stdout, stderr, str(e), "output_limit", _killed(start))
+            finally:
+                if proc.returncode is None:
+                    proc.kill()
+                    await _reap(proc)
+            usage = {
+                "exit_code": proc.returncode if proc.returncode >= 0 else None,
+                "signal": signal_name(-proc.returncode) if proc.returncode < 0 else None,
+                "wall_ms": round((time.perf_counter() - start) * 1000, 1),
             }
-        except subprocess.TimeoutExpired:
-            return {"success": False, "output": "", "error": f"Timeout ({self.timeout}s)"}
+            return _result(proc.returncode == 0, stdout, stderr, usage=usage)
         except Exception as e:
-            return {"success": False, "output": "", "error": str(e)}
+            return _result(False, _Output("stdout", 0), _Output("stderr", 0), str(e), "error")
         finally:
             try:
                 os.unlink(filepath)
             except OSError:
                 pass
+
+    def stats(self) -> dict:
+        return {"pool": self.pool.stats() if self.pool is not None else None}
@@ -0,0 +1,277 @@
+"""Warm interpreter used by CodeRunner's worker pool (POSIX only).
+
+Started as ``python -m backend.code_worker`` with a control pipe's write
+end open as CODE_WORKER_CONTROL_FD. It imports the preload modules once,
+writes ``ready`` to the control pipe and then reads one JSON request per
+line from stdin: ``{"code": "..."}``. Each snippet runs in a child forked
+from this process, so it starts with the modules already imported but
+can never change the worker's own state. The child closes the control
+pipe first and writes straight to the worker's stdout/stderr.
+
+Only after forking does the worker pick the run's end-of-output marker,
+and it sends it over the control pipe, so the snippet can neither know
+nor forge it. The child leads its own process group, which is killed
+once it exits, so nothing it started can outlive the run. On Linux the
+worker then checks that no other process still holds its stdout/stderr
+(something that left the group); any that do are killed and the result
+says ``leaked`` so the pool retires the worker. Then it writes the marker
+to stdout and stderr, and a JSON result line (exit status and resource
+usage) to the control pipe. SIGTERM makes the worker kill the current
+run's group and exit.
+
+This module also defines the per-run resource limits. They are applied
+here to forked children, and by CodeRunner to cold-spawned processes.
+"""
+import atexit
+import importlib
+import json
+import linecache
+import os
+import secrets
+import sys
+import signal
+import tempfile
+import time
+import traceback
+
+try:
+    import pwd
+    import resource
+except ImportError:  # Windows
+    pwd = resource = None
+
+SNIPPET_FILENAME = "<snippet>"
+
+# Per-run limits; 0 disables one. CPU is seconds of CPU time (SIGXCPU, then SIGKILL
+# a second later), AS is address space in MiB. NPROC counts every process and thread
+# of the user snippets run as, and the kernel ignores it for root (see CODE_RUNNER_USER).
+CODE_RUNNER_LIMIT_CPU = int(os.getenv("CODE_RUNNER_LIMIT_CPU", "30"))
+CODE_RUNNER_LIMIT_AS_MB = int(os.getenv("CODE_RUNNER_LIMIT_AS_MB", "512"))
+CODE_RUNNER_LIMIT_NOFILE = int(os.getenv("CODE_RUNNER_LIMIT_NOFILE", "64"))
+CODE_RUNNER_LIMIT_NPROC = int(os.getenv("CODE_RUNNER_LIMIT_NPROC", "256"))
+# When the API runs as root (as in the Docker image), snippets run as this user instead,
+# so NPROC applies and they cannot touch root-owned files. Empty keeps root.
+CODE_RUNNER_USER = os.getenv("CODE_RUNNER_USER", "nobody")
+
+
+def _set_limit(name: str, soft: int, hard: int = None):
+    kind = getattr(resource, name, None)
+    if kind is None or soft <= 0:
+        return
+    _, current_hard = resource.getrlimit(kind)
+    hard = soft if hard is None else hard
+    # Unprivileged processes cannot raise the hard limit
+    if current_hard != resource.RLIM_INFINITY:
+        hard = min(hard, current_hard)
+        soft = min(soft, hard)
+    resource.setrlimit(kind, (soft, hard))
+
+
+def apply_limits():
+    """Apply the CODE_RUNNER_LIMIT_* rlimits to the current process (POSIX only)."""
+    if resource is None:
+        return
+    _set_limit("RLIMIT_CPU", CODE_RUNNER_LIMIT_CPU, CODE_RUNNER_LIMIT_CPU + 1)
+    _set_limit("RLIMIT_AS", CODE_RUNNER_LIMIT_AS_MB * 1024 * 1024)
+    _set_limit("RLIMIT_NOFILE", CODE_RUNNER_LIMIT_NOFILE)
+    _set_limit("RLIMIT_NPROC", CODE_RUNNER_LIMIT_NPROC)
+
+
+def sandbox_ids():
+    """(uid, gid) snippets run as, or None to keep the current user. KeyError if CODE_RUNNER_USER is unknown."""
+    if pwd is None or not CODE_RUNNER_USER or os.geteuid() != 0:
+        return None
+    entry = pwd.getpwnam(CODE_RUNNER_USER)
+    return entry.pw_uid, entry.pw_gid
+
+
+def drop_privileges(ids):
+    if ids is not None:
+        os.setgroups([])
+        os.setgid(ids[1])
+        os.setuid(ids[0])
+
+
+def signal_name(number: int):
+    try:
+        return signal.Signals(number).name
+    except ValueError:
+        return str(number)
+
+
+def _run_child(code: str, ids, control: int):
+    # Results and markers travel on this pipe; the snippet must not be able to write to it
+    os.close(control)
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    apply_limits()
+    drop_privileges(ids)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    sys.stdin = open(0, closefd=False)
+    sys.argv = [SNIPPET_FILENAME]
+    # Same working directory and import path a script in the temp dir would get
+    os.chdir(tempfile.gettempdir())
+    sys.path[0] = tempfile.gettempdir()
+    # Lets tracebacks show the offending source lines
+    linecache.cache[SNIPPET_FILENAME] = (len(code), None, code.splitlines(True), SNIPPET_FILENAME)
+
+    namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+    status = 0
+    try:
+        exec(compile(code, SNIPPET_FILENAME, "exec"), namespace)
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            status = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+            status = 1
+    except BaseException as e:
+        # Drop this frame so the traceback starts at the snippet, like a script would
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        status = 1
+    # Do what interpreter shutdown would (join threads, atexit, flush) but skip
+    # tearing down every inherited module, which costs more than the fork itself
+    if "threading" in sys.modules:
+        sys.modules["threading"]._shutdown()
+    atexit._run_exitfuncs()
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            pass
+    os._exit(status & 0xFF)
+
+
+def _write(fd: int, data: bytes):
+    while data:
+        data = data[os.write(fd, data):]
+
+
+def _kill_group(pgid: int):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _forks() -> int:
+    """Processes created on this machine since boot (Linux), else -1."""
+    try:
+        with open("/proc/stat", "rb") as stat:
+            for line in stat:
+                if line.startswith(b"processes "):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return -1
+
+
+def _stat(pid) -> tuple:
+    """(process group, start time in clock ticks) from /proc/<pid>/stat."""
+    with open(f"/proc/{pid}/stat", "rb") as stat:
+        fields = stat.read().rpartition(b")")[2].split()
+    return int(fields[2]), int(fields[19])
+
+
+def _pipe_holders(group: int, since: int) -> list:
+    """PIDs of processes started since the run began, outside its (already killed) group,
+    that still have this worker's stdout/stderr open."""
+    try:
+        pipes = {os.readlink(f"/proc/self/fd/{fd}") for fd in (1, 2)}
+        pids = [int(name) for name in os.listdir("/proc") if name.isdigit()]
+    except OSError:
+        return []
+    holders = []
+    for pid in pids:
+        try:
+            pgid, started = _stat(pid)
+            # Group members were SIGKILLed but may not have closed their files yet
+            if started < since or pgid == group or pid == os.getpid():
+                continue
+            if any(os.readlink(f"/proc/{pid}/fd/{fd}") in pipes for fd in os.listdir(f"/proc/{pid}/fd")):
+                holders.append(pid)
+        except (OSError, ValueError, IndexError):
+            continue
+    return holders
+
+
+_child = 0
+
+
+def _terminate(signum, frame):
+    # The pool is discarding this worker mid-run (timeout, output limit)
+    if _child:
+        _kill_group(_child)
+    os._exit(1)
+
+
+def main():
+    global _child
+    signal.signal(signal.SIGTERM, _terminate)
+    for name in filter(None, (m.strip() for m in os.getenv("CODE_RUNNER_PRELOAD", "").split(","))):
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    control = int(os.environ.pop("CODE_WORKER_CONTROL_FD"))
+    # Resolved once, before ready: an unknown user fails the worker rather than running snippets as root
+    ids = sandbox_ids()
+    sys.stdout.flush()
+    _write(control, b"ready\n")
+
+    for line in sys.stdin:
+        code = json.loads(line)["code"]
+        start = time.perf_counter()
+        forks = _forks()
+        pid = os.fork()
+        if pid == 0:
+            _run_child(code, ids, control)
+        marker = f"\x00{secrets.token_hex(16)}\x00".encode()
+        _write(control, marker + b"\n")
+        try:
+            # Also here, so the group exists before this process can try to kill it
+            os.setpgid(pid, pid)
+        except OSError:
+            pass
+        _child = pid
+        if hasattr(os, "waitid"):
+            # Wait without reaping, so the pid (and group id) cannot be reused before the kill
+            os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+        _kill_group(pid)
+        # Only worth scanning if the snippet (or anything else) created a process meanwhile
+        leaked = []
+        if _forks() - forks > 1:
+            try:
+                leaked = _pipe_holders(pid, _stat(pid)[1])
+            except (OSError, ValueError, IndexError):
+                pass
+        _, status, usage = os.wait4(pid, 0)
+        _child = 0
+        wall = time.perf_counter() - start
+        for holder in leaked:
+            try:
+                os.kill(holder, signal.SIGKILL)
+            except OSError:
+                pass
+        exit_code = os.waitstatus_to_exitcode(status)
+        result = {
+            "exit_code": exit_code if exit_code >= 0 else None,
+            "signal": signal_name(-exit_code) if exit_code < 0 else None,
+            "wall_ms": round(wall * 1000, 1),
+            "cpu_user_ms": round(usage.ru_utime * 1000, 1),
+            "cpu_sys_ms": round(usage.ru_stime * 1000, 1),
+            # Includes pages shared with the warm worker; bytes on macOS, KiB elsewhere
+            "peak_rss_kb": usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss,
+            "leaked": len(leaked),
+        }
+        _write(1, marker)
+        _write(2, marker)
+        _write(control, json.dumps(result).encode() + b"\n")
+        # The next child inherits this frame; a spent marker is useless, but keep it out of reach
+        del marker
+
+
+if __name__ == "__main__":
+    main()
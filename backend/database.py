@@ -1,84 +1,199 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
 from psycopg2.extras import RealDictCursor
-import time
+from psycopg2.pool import ThreadedConnectionPool
+
+from backend.metrics import db_pool_acquire
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://myuser:mypassword@db:5432/mytools")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "10"))
+# Connections idle for longer than this are pinged before being handed out
+DB_HEALTH_CHECK_AFTER = float(os.getenv("DB_HEALTH_CHECK_AFTER", "30"))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 pool with bounded waits, health checks and stats."""
+
+    def __init__(self, dsn: str, minconn: int = 1, maxconn: int = 10,
+                 acquire_timeout: float = 10, health_check_after: float = 30):
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.health_check_after = health_check_after
+        self._pool = ThreadedConnectionPool(minconn, maxconn, dsn, cursor_factory=RealDictCursor)
+        # The psycopg2 pool raises immediately when exhausted; the semaphore makes callers wait instead
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self._in_use = 0
+        self._waiting = 0
+        self._acquired = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def getconn(self, timeout: float = None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.perf_counter()
+        with self._lock:
+            self._waiting += 1
+        acquired = self._slots.acquire(timeout=timeout)
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._waiting -= 1
+            db_pool_acquire.observe(waited)
+            if not acquired:
+                self._timeouts += 1
+        if not acquired:
+            raise PoolTimeout(f"Timed out after {timeout}s waiting for a database connection")
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        close = close or conn.closed
+        with self._lock:
+            self._in_use -= 1
+            if close:
+                self._discarded += 1
+                self._last_used.pop(id(conn), None)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+
+    def _checkout(self):
+        # Hand out a live connection, replacing any that went stale while idle
+        for _ in range(2):
+            conn = self._pool.getconn()
+            if self._is_healthy(conn):
+                return conn
+            with self._lock:
+                self._discarded += 1
+                self._last_used.pop(id(conn), None)
+            self._pool.putconn(conn, close=True)
+        return self._pool.getconn()
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
 
-def get_db_connection():
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commit on success, roll back on error."""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def stats(self) -> dict:
+        with self._lock:
+            open_conns = len(self._pool._pool) + len(self._pool._used)
+            return {
+                "max_size": self.maxconn,
+                "open": open_conns,
+                "in_use": self._in_use,
+                "idle": len(self._pool._pool),
+                "waiting": self._waiting,
+                "acquired_total": self._acquired,
+                "timeouts_total": self._timeouts,
+                "discarded_total": self._discarded,
+                "wait_avg_ms": round(self._wait_total / self._acquired * 1000, 3) if self._acquired else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+    def close(self):
+        self._pool.closeall()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _create_pool()
+    return _pool
+
+
+def _create_pool() -> ConnectionPool:
     # Retry logic for DB connection (useful in docker-compose)
     for _ in range(5):
         try:
-            conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-            return conn
-        except Exception as e:
+            return ConnectionPool(
+                DATABASE_URL,
+                minconn=DB_POOL_MIN,
+                maxconn=DB_POOL_MAX,
+                acquire_timeout=DB_ACQUIRE_TIMEOUT,
+                health_check_after=DB_HEALTH_CHECK_AFTER,
+            )
+        except psycopg2.OperationalError as e:
             print(f"Database connection failed, retrying... {e}")
             time.sleep(2)
     raise Exception("Could not connect to the database")
 
-def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # websites table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS websites (
-            id SERIAL PRIMARY KEY,
-            name TEXT NOT NULL,
-            link TEXT NOT NULL,
-            icon TEXT,
-            description TEXT,
-            category TEXT DEFAULT 'General'
-        )
-    ''')
-    
-    # servers table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS servers (
-            id SERIAL PRIMARY KEY,
-            server_name TEXT NOT NULL,
-            provider TEXT,
-            provider_link TEXT,
-            client TEXT,
-            server_ip TEXT,
-            description TEXT
-        )
-    ''')
-    
-    # tasks table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tasks (
-            id SERIAL PRIMARY KEY,
-            task_name TEXT NOT NULL,
-            category TEXT,
-            client TEXT,
-            status TEXT DEFAULT 'Pending',
-            date_created TEXT,
-            date_completed TEXT
-        )
-    ''')
-
-    # notes table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS notes (
-            id SERIAL PRIMARY KEY,
-            content TEXT NOT NULL,
-            tags TEXT,
-            ref_link TEXT,
-            images TEXT,
-            date_created TEXT
-        )
-    ''')
-    
-    # users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            hashed_password TEXT NOT NULL
-        )
-    ''')
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def connect():
+    """A dedicated connection outside the pool, for work that holds one for long (streaming exports)."""
+    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+
+
+@contextmanager
+def db_cursor():
+    """Pooled cursor for a single unit of work; commits when the block exits cleanly."""
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
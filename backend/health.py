@@ -0,0 +1,300 @@
+"""Background reachability probes for the servers table.
+
+One scheduler task keeps a heap of (due time, server) and starts probes
+as they fall due, at most HEALTH_PROBE_CONCURRENCY at a time, so the cost
+is a heap pop per probe and one task per probe in flight, not a task or
+timer per server. Each server is probed every HEALTH_PROBE_INTERVAL
+seconds with +/- HEALTH_PROBE_JITTER spread, and first probes are spread
+over one interval so a restart does not probe everything at once.
+
+``server_ip`` decides the probe: an http(s):// URL gets a GET (up unless
+it answers 5xx), anything else a TCP connect to ``host[:port]``
+(HEALTH_PROBE_PORT when no port is given). Results live in memory in a
+fixed-size ring per server; every worker probes on its own.
+"""
+import asyncio
+import heapq
+import math
+import os
+import random
+import time
+from array import array
+from typing import Optional
+
+import httpx
+
+from backend.database import db_cursor
+from backend.metrics import health_probe_duration, health_probes_total
+from backend.repository import run_in_db
+
+HEALTH_PROBE_ENABLED = os.getenv("HEALTH_PROBE_ENABLED", "true").lower() in ("1", "true", "yes")
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "60"))
+HEALTH_PROBE_JITTER = float(os.getenv("HEALTH_PROBE_JITTER", "0.1"))
+HEALTH_PROBE_CONCURRENCY = int(os.getenv("HEALTH_PROBE_CONCURRENCY", "100"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "3"))
+HEALTH_PROBE_PORT = int(os.getenv("HEALTH_PROBE_PORT", "22"))
+HEALTH_HISTORY_SIZE = int(os.getenv("HEALTH_HISTORY_SIZE", "60"))
+# How often the server list is re-read, picking up added or edited servers
+HEALTH_REFRESH_INTERVAL = float(os.getenv("HEALTH_REFRESH_INTERVAL", "30"))
+
+
+def parse_target(address: str, default_port: int = HEALTH_PROBE_PORT):
+    """("http", url) or ("tcp", host, port) for a server_ip value; None if there is nothing to probe."""
+    address = (address or "").strip()
+    if not address:
+        return None
+    if address.startswith(("http://", "https://")):
+        return ("http", address)
+    host, port = address, default_port
+    if address.startswith("["):
+        # [v6]:port
+        host, _, rest = address[1:].partition("]")
+        if rest.startswith(":") and rest[1:].isdigit():
+            port = int(rest[1:])
+    elif address.count(":") == 1:
+        name, _, maybe_port = address.partition(":")
+        if maybe_port.isdigit():
+            host, port = name, int(maybe_port)
+    return ("tcp", host, port)
+
+
+class HealthHistory:
+    """Ring of the last ``size`` probe results: timestamps and latencies (NaN = down)."""
+
+    __slots__ = ("times", "latencies", "next", "count", "last_error")
+
+    def __init__(self, size: int = HEALTH_HISTORY_SIZE):
+        self.times = array("d", bytes(8 * size))
+        self.latencies = array("f", bytes(4 * size))
+        self.next = 0
+        self.count = 0
+        self.last_error = None
+
+    def record(self, at: float, latency_ms: Optional[float], error: str = None):
+        self.times[self.next] = at
+        self.latencies[self.next] = math.nan if latency_ms is None else latency_ms
+        self.next = (self.next + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+        self.last_error = error
+
+    def samples(self) -> list:
+        """Oldest first, as dicts."""
+        size = len(self.times)
+        start = (self.next - self.count) % size
+        result = []
+        for i in range(self.count):
+            index = (start + i) % size
+            latency = self.latencies[index]
+            result.append({
+                "at": self.times[index],
+                "up": not math.isnan(latency),
+                "latency_ms": None if math.isnan(latency) else round(latency, 2),
+            })
+        return result
+
+    def state(self) -> str:
+        if not self.count:
+            return "unknown"
+        return "down" if math.isnan(self.latencies[(self.next - 1) % len(self.times)]) else "up"
+
+    def summary(self) -> dict:
+        if not self.count:
+            return {"status": "unknown", "latency_ms": None, "checked_at": None, "uptime": None, "error": None}
+        last = (self.next - 1) % len(self.times)
+        latency = self.latencies[last]
+        ups = [v for v in (self.latencies[(last - i) % len(self.times)] for i in range(self.count)) if not math.isnan(v)]
+        return {
+            "status": self.state(),
+            "latency_ms": None if math.isnan(latency) else round(latency, 2),
+            "checked_at": self.times[last],
+            "uptime": round(len(ups) / self.count, 3),
+            "error": self.last_error,
+        }
+
+
+class _Target:
+    __slots__ = ("address", "probe", "generation", "history")
+
+    def __init__(self, address: str, probe, generation: int, history_size: int):
+        self.address = address
+        self.probe = probe
+        self.generation = generation
+        self.history = HealthHistory(history_size)
+
+
+def _load_servers() -> dict:
+    with db_cursor() as cur:
+        cur.execute("SELECT id, server_ip FROM servers WHERE COALESCE(server_ip, '') <> ''")
+        return {row["id"]: row["server_ip"] for row in cur.fetchall()}
+
+
+class HealthMonitor:
+    def __init__(self, interval: float = HEALTH_PROBE_INTERVAL, jitter: float = HEALTH_PROBE_JITTER,
+                 concurrency: int = HEALTH_PROBE_CONCURRENCY, timeout: float = HEALTH_PROBE_TIMEOUT,
+                 default_port: int = HEALTH_PROBE_PORT, history_size: int = HEALTH_HISTORY_SIZE,
+                 refresh_interval: float = HEALTH_REFRESH_INTERVAL, load_servers=_load_servers,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.interval = interval
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.default_port = default_port
+        self.history_size = history_size
+        self.refresh_interval = refresh_interval
+        # Blocking callable returning {server_id: server_ip}; runs on the DB executor
+        self._load_servers = load_servers
+        self._transport = transport
+        self._targets = {}
+        self._heap = []  # (due, server_id, generation)
+        self._generation = 0
+        self._slots = None
+        self._probing = set()
+        self._client = None
+        self._task = None
+        self._wake = None
+        self.probes = 0
+        self.late_ms_max = 0.0
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._wake = asyncio.Event()
+        self._client = httpx.AsyncClient(timeout=self.timeout, transport=self._transport,
+                                         limits=httpx.Limits(max_connections=self.concurrency))
+        self._task = asyncio.create_task(self._run())
+
+    async def aclose(self):
+        tasks = list(self._probing) + ([self._task] if self._task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def refresh(self):
+        """Re-read the server list now: re-addressed servers are probed right away, new ones within one interval."""
+        servers = await run_in_db(self._load_servers)
+        now = time.monotonic()
+        for server_id in [s for s in self._targets if s not in servers]:
+            del self._targets[server_id]
+        for server_id, address in servers.items():
+            target = self._targets.get(server_id)
+            if target is not None and target.address == address:
+                continue
+            probe = parse_target(address, self.default_port)
+            if probe is None:
+                self._targets.pop(server_id, None)
+                continue
+            self._generation += 1
+            self._targets[server_id] = _Target(address, probe, self._generation, self.history_size)
+            # Edited servers are probed right away; the initial load is spread out
+            delay = 0 if target is not None else random.uniform(0, self.interval)
+            heapq.heappush(self._heap, (now + delay, server_id, self._generation))
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self):
+        next_refresh = 0.0
+        while True:
+            now = time.monotonic()
+            if now >= next_refresh:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    print(f"Health monitor could not load servers: {e}")
+                next_refresh = time.monotonic() + self.refresh_interval
+            while self._heap and self._heap[0][0] <= time.monotonic():
+                due, server_id, generation = heapq.heappop(self._heap)
+                target = self._targets.get(server_id)
+                if target is None or target.generation != generation:
+                    continue  # removed or re-addressed since this was scheduled
+                # Waits here when HEALTH_PROBE_CONCURRENCY probes are already running
+                await self._slots.acquire()
+                self.late_ms_max = max(self.late_ms_max, (time.monotonic() - due) * 1000)
+                task = asyncio.create_task(self._probe(server_id, target))
+                self._probing.add(task)
+                task.add_done_callback(self._probe_done)
+            wake_at = min(self._heap[0][0] if self._heap else next_refresh, next_refresh)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, wake_at - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+
+    def _probe_done(self, task):
+        self._probing.discard(task)
+        self._slots.release()
+
+    async def _probe(self, server_id: int, target: _Target):
+        kind = target.probe[0]
+        start = time.perf_counter()
+        error, cancelled = None, False
+        try:
+            if kind == "http":
+                # Status only: the body is never read, so a large or slow one costs nothing
+                async with self._client.stream("GET", target.probe[1]) as response:
+                    if response.status_code >= 500:
+                        error = f"HTTP {response.status_code}"
+            else:
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_connection(target.probe[1], target.probe[2]), self.timeout
+                )
+                writer.transport.abort()
+        except asyncio.TimeoutError:
+            error = "Timed out"
+        except asyncio.CancelledError:
+            cancelled = True  # shutting down
+            raise
+        except Exception as e:
+            # Includes bad stored addresses (IDNA errors, invalid URLs): down, not a dead probe
+            error = str(e) or type(e).__name__
+        finally:
+            if not cancelled:
+                self._finish(server_id, target, kind, start, error)
+
+    def _finish(self, server_id: int, target: _Target, kind: str, start: float, error: Optional[str]):
+        """Record a probe result and schedule the next probe."""
+        elapsed = time.perf_counter() - start
+        self.probes += 1
+        health_probes_total.labels(kind, "down" if error else "up").inc()
+        health_probe_duration.labels(kind).observe(elapsed)
+        target.history.record(time.time(), None if error else elapsed * 1000, error)
+        if self._targets.get(server_id) is target:
+            spread = self.interval * self.jitter
+            due = time.monotonic() + self.interval + random.uniform(-spread, spread)
+            heapq.heappush(self._heap, (due, server_id, target.generation))
+            if self._heap[0][0] == due:
+                # Only matters when nothing else was scheduled sooner
+                self._wake.set()
+
+    def status(self, server_id: int) -> dict:
+        target = self._targets.get(server_id)
+        if target is None:
+            return {"status": "unmonitored", "latency_ms": None, "checked_at": None, "uptime": None, "error": None}
+        return target.history.summary()
+
+    def history(self, server_id: int) -> Optional[list]:
+        target = self._targets.get(server_id)
+        return target.history.samples() if target is not None else None
+
+    def counts(self) -> dict:
+        counts = {"up": 0, "down": 0, "unknown": 0}
+        for target in self._targets.values():
+            counts[target.history.state()] += 1
+        return counts
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "servers": len(self._targets),
+            "status": self.counts(),
+            "probing": len(self._probing),
+            "scheduled": len(self._heap),
+            "probes_total": self.probes,
+            "late_ms_max": round(self.late_ms_max, 1),
+            "interval_s": self.interval,
+            "concurrency": self.concurrency,
+        }
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from backend.cache import LRUCache
+
+CACHEABLE_METHODS = ("GET", "HEAD")
+CACHEABLE_STATUSES = (200, 203, 301, 404, 410)
+# Request headers that change what upstream returns; part of every cache key
+KEY_HEADERS = ("accept", "accept-encoding", "accept-language", "authorization", "cookie")
+
+
+def parse_cache_control(value: Optional[str]) -> dict:
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else True
+    return directives
+
+
+def _lower_keys(headers: Optional[dict]) -> dict:
+    return {k.lower(): v for k, v in (headers or {}).items()}
+
+
+class CachedResponse:
+    __slots__ = ("status", "data", "headers", "http_version", "etag", "last_modified", "vary", "stored_at")
+
+    def __init__(self, status, data, headers, http_version, vary):
+        self.status = status
+        self.data = data
+        self.headers = headers
+        self.http_version = http_version
+        self.etag = headers.get("etag")
+        self.last_modified = headers.get("last-modified")
+        self.vary = vary
+        self.stored_at = time.time()
+
+    def to_result(self, cache_state: str) -> dict:
+        # data/headers are shared with the cache entry, not copied per hit
+        return {
+            "status": self.status,
+            "data": self.data,
+            "headers": self.headers,
+            "http_version": self.http_version,
+            "cache": cache_state,
+            "age": int(time.time() - self.stored_at),
+        }
+
+
+class HttpResponseCache:
+    """Shared response cache for ApiCaller following upstream Cache-Control.
+
+    Fresh entries are served directly; stale ones with an ETag or
+    Last-Modified are revalidated with a conditional request.
+    """
+
+    def __init__(self, max_bytes: int, default_ttl: float = 60, max_entries: int = None):
+        self.default_ttl = default_ttl
+        self._lru = LRUCache(max_bytes, max_entries)
+        self.revalidated = 0
+
+    def key(self, method: str, url: str, params: Optional[dict], headers: Optional[dict]) -> str:
+        lowered = _lower_keys(headers)
+        material = json.dumps(
+            [method, url, sorted((params or {}).items()), [lowered.get(h) for h in KEY_HEADERS]],
+            default=str,
+        )
+        # Hashed so credentials from Authorization/Cookie never sit in memory as keys
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str, request_headers: Optional[dict]):
+        """Return ``(cached, fresh)``; ``cached`` is None on a miss."""
+        request_cc = parse_cache_control(_lower_keys(request_headers).get("cache-control"))
+        if "no-store" in request_cc:
+            return None, False
+        entry = self._lru.get(key, allow_stale=True)
+        if entry is None:
+            return None, False
+        cached = entry.value
+        lowered = _lower_keys(request_headers)
+        if any(lowered.get(name) != value for name, value in cached.vary.items()):
+            return None, False
+        fresh = entry.is_fresh() and "no-cache" not in request_cc
+        if not fresh and not (cached.etag or cached.last_modified):
+            return None, False
+        return cached, fresh
+
+    @staticmethod
+    def conditional_headers(cached: CachedResponse) -> dict:
+        headers = {}
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+        return headers
+
+    def ttl_for(self, status: int, headers: dict) -> Optional[float]:
+        """Seconds the response may be served without revalidation; None if it must not be stored."""
+        if status not in CACHEABLE_STATUSES:
+            return None
+        cc = parse_cache_control(headers.get("cache-control"))
+        if "no-store" in cc or headers.get("vary", "").strip() == "*":
+            return None
+        if "no-cache" in cc:
+            return 0
+        for directive in ("s-maxage", "max-age"):
+            if directive in cc:
+                try:
+                    return max(0, int(cc[directive]) - int(headers.get("age", 0)))
+                except ValueError:
+                    return 0
+        if "expires" in headers:
+            try:
+                return max(0, parsedate_to_datetime(headers["expires"]).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return 0
+        return self.default_ttl
+
+    def store(self, key: str, status: int, data, headers: dict, http_version: str,
+              size: int, request_headers: Optional[dict]) -> Optional[CachedResponse]:
+        ttl = self.ttl_for(status, headers)
+        if ttl is None:
+            self._lru.pop(key)
+            return None
+        lowered = _lower_keys(request_headers)
+        vary = {
+            name.strip().lower(): lowered.get(name.strip().lower())
+            for name in headers.get("vary", "").split(",") if name.strip()
+        }
+        cached = CachedResponse(status, data, headers, http_version, vary)
+        self._lru.set(key, cached, size, ttl)
+        return cached
+
+    def refresh(self, key: str, cached: CachedResponse, not_modified_headers: dict) -> CachedResponse:
+        """Apply a 304 response: merge its headers and restart the freshness clock."""
+        headers = {**cached.headers, **not_modified_headers}
+        refreshed = CachedResponse(cached.status, cached.data, headers, cached.http_version, cached.vary)
+        ttl = self.ttl_for(cached.status, headers)
+        entry = self._lru.get(key, allow_stale=True)
+        if entry is not None:
+            entry.value = refreshed
+            self._lru.touch(key, ttl or 0)
+        self.revalidated += 1
+        return refreshed
+
+    def stats(self) -> dict:
+        return {**self._lru.stats(), "revalidated": self.revalidated}
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import secrets
+import time
+from typing import Optional
+
+from backend.code_runner import CODE_RUNNER_WORKERS
+from backend.metrics import code_run_duration, code_run_queue_duration, code_runs_total
+
+# Runs executing at once, across all users and per user
+RUN_GLOBAL_CONCURRENCY = int(os.getenv("RUN_GLOBAL_CONCURRENCY", str(max(CODE_RUNNER_WORKERS, 1))))
+RUN_USER_CONCURRENCY = int(os.getenv("RUN_USER_CONCURRENCY", "2"))
+# Jobs waiting to start; beyond these, submissions are rejected (HTTP 429)
+RUN_QUEUE_MAX_DEPTH = int(os.getenv("RUN_QUEUE_MAX_DEPTH", "100"))
+RUN_USER_MAX_QUEUED = int(os.getenv("RUN_USER_MAX_QUEUED", "10"))
+# Finished jobs stay pollable for this long
+RUN_JOB_TTL = float(os.getenv("RUN_JOB_TTL", "600"))
+
+FINISHED = ("done", "cancelled", "failed")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    __slots__ = ("id", "owner", "status", "result", "error", "created_at", "started_at", "finished_at", "task")
+
+    def __init__(self, owner: str):
+        self.id = secrets.token_urlsafe(12)
+        self.owner = owner
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+    def to_dict(self) -> dict:
+        now = time.time()
+        queued_until = self.started_at or (self.finished_at if self.status in FINISHED else now)
+        run_ms = None
+        if self.started_at:
+            run_ms = round(((self.finished_at or now) - self.started_at) * 1000, 1)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "queue_ms": round((queued_until - self.created_at) * 1000, 1),
+            "run_ms": run_ms,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """Bounded async scheduler for code runs.
+
+    Jobs wait for a per-user slot first and a global slot second, so a user
+    who is at their own limit never holds a global slot while waiting.
+    Submissions past the queue depth limits raise QueueFull.
+    """
+
+    def __init__(self, concurrency: int = RUN_GLOBAL_CONCURRENCY, user_concurrency: int = RUN_USER_CONCURRENCY,
+                 max_depth: int = RUN_QUEUE_MAX_DEPTH, user_max_queued: int = RUN_USER_MAX_QUEUED,
+                 job_ttl: float = RUN_JOB_TTL):
+        self.concurrency = concurrency
+        self.user_concurrency = user_concurrency
+        self.max_depth = max_depth
+        self.user_max_queued = user_max_queued
+        self.job_ttl = job_ttl
+        self._global = None
+        self._users = {}
+        self._jobs = {}
+        self._queued = {}  # owner -> number of jobs not yet started
+        self.rejected = 0
+        self.completed = 0
+        self.cancelled = 0
+
+    def _user_slots(self, owner: str) -> asyncio.Semaphore:
+        slots = self._users.get(owner)
+        if slots is None:
+            slots = self._users[owner] = asyncio.Semaphore(self.user_concurrency)
+        return slots
+
+    def _purge(self):
+        cutoff = time.time() - self.job_ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+        # Drop idle per-user semaphores along with the last of their jobs
+        owners = {job.owner for job in self._jobs.values()}
+        for owner in [o for o in self._users if o not in owners]:
+            del self._users[owner]
+
+    def submit(self, owner: str, run) -> Job:
+        """Queue ``run()`` (a coroutine function) for ``owner``; raises QueueFull."""
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.concurrency)
+        self._purge()
+        if self.queued() >= self.max_depth:
+            self.rejected += 1
+            raise QueueFull("Run queue is full, try again shortly")
+        if self._queued.get(owner, 0) >= self.user_max_queued:
+            self.rejected += 1
+            raise QueueFull(f"Too many queued runs (limit {self.user_max_queued})")
+
+        job = Job(owner)
+        self._jobs[job.id] = job
+        self._queued[owner] = self._queued.get(owner, 0) + 1
+        job.task = asyncio.create_task(self._execute(job, run))
+        return job
+
+    async def _execute(self, job: Job, run):
+        started = False
+        try:
+            async with self._user_slots(job.owner), self._global:
+                started = True
+                self._dequeue(job.owner)
+                job.status = "running"
+                job.started_at = time.time()
+                job.result = await run()
+            job.status = "done"
+            self.completed += 1
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            self.cancelled += 1
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            if not started:
+                self._dequeue(job.owner)
+            job.finished_at = time.time()
+            self._observe(job)
+        return job
+
+    @staticmethod
+    def _observe(job: Job):
+        if job.started_at:
+            code_run_queue_duration.observe(job.started_at - job.created_at)
+            code_run_duration.observe(job.finished_at - job.started_at)
+        reason = ""
+        if isinstance(job.result, dict):
+            reason = job.result.get("reason") or ("" if job.result.get("success") else "error")
+        code_runs_total.labels(job.status, reason).inc()
+
+    def _dequeue(self, owner: str):
+        remaining = self._queued.get(owner, 0) - 1
+        if remaining > 0:
+            self._queued[owner] = remaining
+        else:
+            self._queued.pop(owner, None)
+
+    def get(self, job_id: str, owner: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        return job if job is not None and job.owner == owner else None
+
+    async def wait(self, job: Job) -> Job:
+        # Shielded: a caller giving up does not cancel the job by itself
+        await asyncio.shield(job.task)
+        return job
+
+    def cancel(self, job: Job) -> bool:
+        if job.status in FINISHED:
+            return False
+        job.task.cancel()
+        return True
+
+    async def aclose(self):
+        tasks = [job.task for job in self._jobs.values() if job.status not in FINISHED]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def running(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == "running")
+
+    def queued(self) -> int:
+        return sum(self._queued.values())
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "user_concurrency": self.user_concurrency,
+            "max_depth": self.max_depth,
+            "queued": self.queued(),
+            "running": self.running(),
+            "tracked_jobs": len(self._jobs),
+            "completed_total": self.completed,
+            "cancelled_total": self.cancelled,
+            "rejected_total": self.rejected,
+        }
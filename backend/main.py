@@ -1,36 +1,91 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+import time
+_import_started = time.perf_counter()  # main's import time goes in the startup report
+
+from fastapi import FastAPI, Depends, File, HTTPException, Header, Query, Request, Response, UploadFile, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from typing import List, Optional
+from contextlib import asynccontextmanager
 import os
+import asyncio
+import json
 import jwt
+import secrets
 from datetime import datetime, timedelta
-import bcrypt
 
 from backend.code_runner import CodeRunner
-from backend.api_caller import ApiCaller
-from backend.ai_service import AiService
-from backend.database import init_db, get_db_connection
+from backend.jobs import JobQueue, QueueFull
+from backend.api_caller import ApiCaller, API_STREAM_MAX_BYTES
+from backend.ai_service import AiService, AI_SDK_WARMUP
+from backend.ai_cache import AiResponseCache
+from backend.ai_router import AiRouter
+from backend.attachments import (
+    AttachmentStore, AttachmentTooLarge, CHUNK_SIZE, IMAGE_TYPES, UnsupportedAttachment,
+)
+from backend.database import get_pool, close_pool
+from backend.migrations import migrate
+from backend import bulk, repository
+from backend.auth import PasswordHasher, TokenCache
+from backend.changes import ChangeFeed
+from backend.health import HEALTH_PROBE_ENABLED, HealthMonitor
+from backend import metrics
 
 # Settings for JWT
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7 # 7 days
+# Bearer token a scraper must send to /metrics; unset leaves the endpoint open
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Change streams send a comment this often when idle, and end after CHANGES_STREAM_MAX_AGE so
+# clients reconnect (resuming from Last-Event-ID) and a shutting-down worker is not held open
+CHANGES_HEARTBEAT = float(os.getenv("CHANGES_HEARTBEAT", "15"))
+CHANGES_STREAM_MAX_AGE = float(os.getenv("CHANGES_STREAM_MAX_AGE", "300"))
 
-def verify_password(plain_password, hashed_password):
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-
-def get_password_hash(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+password_hasher = PasswordHasher()
+token_cache = TokenCache()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-# Initialize the database
-init_db()
-
-app = FastAPI(title="PyTool Backend")
+attachment_store = AttachmentStore()
+startup_report = {}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    startup_report["import_ms"] = round((started - _import_started) * 1000, 1)
+    # Blocking DB work runs on the repository executor, not the event loop
+    startup_report["schema"] = await repository.run_in_db(migrate)
+    await api_caller.start()
+    await code_runner.start()
+    await change_feed.start()
+    if HEALTH_PROBE_ENABLED:
+        await health_monitor.start()
+    warmup = None
+    if AI_SDK_WARMUP == "blocking":
+        await ai_service.warmup()
+    elif AI_SDK_WARMUP == "background":
+        warmup = asyncio.create_task(ai_service.warmup())
+    startup_report["startup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    print(f"Startup: import {startup_report['import_ms']}ms, schema v{startup_report['schema']['version']} "
+          f"({len(startup_report['schema']['applied'])} applied), ready in {startup_report['startup_ms']}ms")
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    await health_monitor.aclose()
+    await change_feed.aclose()
+    await api_caller.aclose()
+    await run_queue.aclose()
+    await code_runner.aclose()
+    await ai_service.aclose()
+    password_hasher.shutdown()
+    repository.shutdown_executor()
+    close_pool()
+
+app = FastAPI(title="PyTool Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -38,11 +93,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+# Added last so it wraps everything else, CORS preflights included
+app.add_middleware(metrics.MetricsMiddleware)
 
 code_runner = CodeRunner()
+run_queue = JobQueue()
 api_caller = ApiCaller()
-ai_service = AiService()
+ai_service = AiService(cache=AiResponseCache())
+ai_router = AiRouter(ai_service)
+change_feed = ChangeFeed()
+health_monitor = HealthMonitor()
+
+def _pool_gauge(*fields):
+    def read():
+        stats = get_pool().stats()
+        return {(field,): stats[field] for field in fields}
+    return read
+
+metrics.REGISTRY.callback_gauge("code_runs_queued", "Code runs waiting for a slot", run_queue.queued)
+metrics.REGISTRY.callback_gauge("code_runs_running", "Code runs executing", run_queue.running)
+metrics.REGISTRY.callback_gauge(
+    "code_workers_idle", "Warm code workers ready for a run",
+    lambda: code_runner.pool.stats()["idle"] if code_runner.pool is not None else None)
+metrics.REGISTRY.callback_gauge(
+    "change_feed_subscribers", "Open change streams on this worker", lambda: change_feed.stats()["subscribers"])
+metrics.REGISTRY.callback_gauge(
+    "health_servers", "Probed servers by last result", lambda: {(k,): v for k, v in health_monitor.counts().items()},
+    ("status",))
+metrics.REGISTRY.callback_gauge(
+    "db_pool_connections", "Pooled database connections by state", _pool_gauge("in_use", "idle"), ("state",))
+metrics.REGISTRY.callback_gauge(
+    "db_pool_waiting", "Threads waiting for a database connection", lambda: get_pool().stats()["waiting"])
 
 # --- Auth Helpers ---
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -62,13 +145,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
+        return token_cache.decode(token, SECRET_KEY, [ALGORITHM])
     except jwt.PyJWTError:
         raise credentials_exception
-    return username
 
 # --- Request Models ---
 class UserAuth(BaseModel):
@@ -85,6 +164,12 @@ class ApiCallRequest(BaseModel):
     headers: Optional[dict] = None
     body: Optional[dict] = None
     params: Optional[dict] = None
+    cache: bool = False
+
+class ApiBatchRequest(BaseModel):
+    requests: List[ApiCallRequest] = Field(..., max_length=500)
+    concurrency: int = Field(20, ge=1, le=100)
+    item_timeout: Optional[float] = Field(None, gt=0)
 
 class AiChatRequest(BaseModel):
     prompt: str
@@ -92,6 +177,10 @@ class AiChatRequest(BaseModel):
     model: Optional[str] = None
     system_prompt: str = "You are a helpful assistant."
     api_key: Optional[str] = None
+    cache: bool = True
+    # Fall back to other configured providers on error/timeout; hedge races a second one when slow
+    routing: bool = False
+    hedge: bool = False
 
 class Website(BaseModel):
     name: str
@@ -120,23 +209,55 @@ class Note(BaseModel):
     content: str
     tags: Optional[str] = ""
     ref_link: Optional[str] = ""
-    images: Optional[str] = "[]"
+    images: Optional[str] = "[]"  # JSON array of attachment IDs
     date_created: Optional[str] = None
 
+    @field_validator("images")
+    @classmethod
+    def images_are_attachment_ids(cls, value):
+        # Images are uploaded to /attachments first; inline data URLs are not accepted
+        if value is None:
+            return value
+        try:
+            images = json.loads(value)
+        except ValueError:
+            raise ValueError("must be a JSON array of attachment IDs")
+        if not isinstance(images, list) or not all(
+            isinstance(image, str) and AttachmentStore.is_valid_id(image) for image in images
+        ):
+            raise ValueError("must be a JSON array of attachment IDs")
+        return json.dumps(images)
+
+# --- List Helpers ---
+class PageParams:
+    def __init__(
+        self,
+        sort: Optional[str] = Query(None, description="Column to order by, prefix with '-' for descending"),
+        limit: int = Query(repository.DEFAULT_PAGE_SIZE, ge=1, le=repository.MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    ):
+        self.sort = sort
+        self.limit = limit
+        self.cursor = cursor
+
+async def list_page(repo, filters: dict, page: PageParams, response: Response):
+    try:
+        rows, next_cursor = await repo.list(filters, page.sort, page.limit, page.cursor)
+    except repository.InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
 # --- Auth Endpoints ---
 @app.post("/auth/register")
 async def register(user: UserAuth):
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT 1")
-        cur.execute("SELECT * FROM users WHERE username = %s", (user.username,))
-        if cur.fetchone():
+        if await repository.users.get_by_username(user.username):
             raise HTTPException(status_code=400, detail="Username already exists")
-        
-        hashed_pwd = get_password_hash(user.password)
-        cur.execute("INSERT INTO users (username, hashed_password) VALUES (%s, %s)", (user.username, hashed_pwd))
-        conn.commit()
+
+        hashed_pwd = await password_hasher.hash(user.password)
+        await repository.users.create(user.username, hashed_pwd)
         return {"message": "User registered successfully"}
     except HTTPException:
         raise
@@ -144,40 +265,107 @@ async def register(user: UserAuth):
         import traceback
         print(f"Registration error: {e}")
         traceback.print_exc()
-        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
-    finally:
-        cur.close()
-        conn.close()
 
 @app.post("/auth/login")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT * FROM users WHERE username = %s", (form_data.username,))
-        user = cur.fetchone()
-        
-        if not user or not verify_password(form_data.password, user['hashed_password']):
-            raise HTTPException(status_code=400, detail="Incorrect username or password")
-
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user['username']}, expires_delta=access_token_expires
-        )
-        return {"access_token": access_token, "token_type": "bearer"}
-    finally:
-        cur.close()
-        conn.close()
+    user = await repository.users.get_by_username(form_data.username)
+    if not user or not await password_hasher.verify(form_data.password, user['hashed_password']):
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
+    if password_hasher.needs_rehash(user['hashed_password']):
+        # BCRYPT_ROUNDS changed since this hash was made; upgrade it while we have the password
+        await repository.users.update_password(user['username'], await password_hasher.hash(form_data.password))
+
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": user['username']}, expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer"}
 
 # --- Protected App Endpoints ---
 @app.get("/me")
 async def get_me(username: str = Depends(get_current_user)):
     return {"username": username}
 
+def submit_run(username: str, run):
+    try:
+        return run_queue.submit(username, run)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+
+def get_run_job(job_id: str, username: str):
+    job = run_queue.get(job_id, username)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def run_result(job) -> dict:
+    info = job.to_dict()
+    result = info.pop("result") or {"success": False, "output": "", "error": info["error"] or f"Run {job.status}",
+                                    "truncated": False, "reason": job.status}
+    return {**result, "job_id": info["job_id"], "status": info["status"],
+            "queue_ms": info["queue_ms"], "run_ms": info["run_ms"]}
+
 @app.post("/run-code")
 async def run_code(req: RunCodeRequest, username: str = Depends(get_current_user)):
-    return code_runner.run(req.code, req.timeout)
+    job = submit_run(username, lambda: code_runner.run(req.code, req.timeout))
+    try:
+        await run_queue.wait(job)
+    except asyncio.CancelledError:
+        # Client went away; stop its run instead of finishing it for nobody
+        run_queue.cancel(job)
+        raise
+    return run_result(job)
+
+@app.post("/run-code/stream")
+async def run_code_stream(req: RunCodeRequest, username: str = Depends(get_current_user)):
+    """Server-Sent Events: queued, started, stdout/stderr chunks as printed, then done."""
+    events = asyncio.Queue()
+
+    async def run():
+        events.put_nowait({"type": "started"})
+        return await code_runner.run(
+            req.code, req.timeout, on_output=lambda stream, text: events.put_nowait({"type": stream, "data": text})
+        )
+
+    job = submit_run(username, run)
+    job.task.add_done_callback(lambda _: events.put_nowait(None))
+
+    async def stream():
+        try:
+            yield f"event: queued\ndata: {json.dumps({'type': 'queued', 'job_id': job.id})}\n\n"
+            while (event := await events.get()) is not None:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            # Output and stderr were already streamed; the final event only carries the outcome
+            done = {k: v for k, v in run_result(job).items() if k not in ("output", "error")}
+            yield f"event: done\ndata: {json.dumps({'type': 'done', **done})}\n\n"
+        finally:
+            run_queue.cancel(job)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/run-code/jobs", status_code=202)
+async def create_run_job(req: RunCodeRequest, username: str = Depends(get_current_user)):
+    return submit_run(username, lambda: code_runner.run(req.code, req.timeout)).to_dict()
+
+@app.get("/run-code/jobs/{job_id}")
+async def get_run_job_status(job_id: str, username: str = Depends(get_current_user)):
+    return get_run_job(job_id, username).to_dict()
+
+@app.delete("/run-code/jobs/{job_id}")
+async def cancel_run_job(job_id: str, username: str = Depends(get_current_user)):
+    job = get_run_job(job_id, username)
+    if run_queue.cancel(job):
+        await asyncio.wait([job.task])
+    return job.to_dict()
+
+@app.get("/run-code/stats")
+async def run_code_stats(username: str = Depends(get_current_user)):
+    return {**code_runner.stats(), "queue": run_queue.stats()}
 
 @app.post("/call-api")
 async def call_api(req: ApiCallRequest, username: str = Depends(get_current_user)):
@@ -187,162 +375,427 @@ async def call_api(req: ApiCallRequest, username: str = Depends(get_current_user
         headers=req.headers,
         body=req.body,
         params=req.params,
+        cache=req.cache,
     )
 
+@app.post("/call-api/batch")
+async def call_api_batch(req: ApiBatchRequest, username: str = Depends(get_current_user)):
+    async def results():
+        async for result in api_caller.call_many(
+            [r.model_dump() for r in req.requests],
+            concurrency=req.concurrency,
+            item_timeout=req.item_timeout,
+        ):
+            yield json.dumps(result, default=str) + "\n"
+
+    # NDJSON: one line per call, in completion order
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.post("/call-api/stream")
+async def call_api_stream(
+    req: ApiCallRequest,
+    max_bytes: int = Query(API_STREAM_MAX_BYTES, ge=1, le=API_STREAM_MAX_BYTES),
+    username: str = Depends(get_current_user),
+):
+    async def frames():
+        async for frame in api_caller.stream(
+            url=req.url,
+            method=req.method,
+            headers=req.headers,
+            body=req.body,
+            params=req.params,
+            max_bytes=max_bytes,
+        ):
+            yield json.dumps(frame) + "\n"
+
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
+
+@app.get("/call-api/stats")
+async def call_api_stats(username: str = Depends(get_current_user)):
+    return api_caller.stats()
+
 @app.post("/ai/chat")
 async def ai_chat(req: AiChatRequest, username: str = Depends(get_current_user)):
-    return await ai_service.chat(
+    return await ai_router.chat(
         prompt=req.prompt,
         provider=req.provider,
         model=req.model,
         system_prompt=req.system_prompt,
         api_key=req.api_key,
+        use_cache=req.cache,
+        routing=req.routing,
+        hedge=req.hedge,
+    )
+
+@app.post("/ai/chat/stream")
+async def ai_chat_stream(req: AiChatRequest, username: str = Depends(get_current_user)):
+    async def events():
+        # Starlette cancels this generator when the client disconnects,
+        # which closes the upstream provider stream as well
+        async for event in ai_service.chat_stream(
+            prompt=req.prompt,
+            provider=req.provider,
+            model=req.model,
+            system_prompt=req.system_prompt,
+            api_key=req.api_key,
+        ):
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
+@app.get("/ai/stats")
+async def ai_stats(username: str = Depends(get_current_user)):
+    return ai_service.stats()
+
+@app.get("/ai/routing")
+async def ai_routing(username: str = Depends(get_current_user)):
+    return ai_router.stats()
+
+@app.get("/startup")
+async def startup_stats(username: str = Depends(get_current_user)):
+    return {**startup_report, "sdk_imports_ms": ai_service.sdk_imports}
+
+@app.get("/metrics")
+async def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and not secrets.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/db/pool")
+async def db_pool_stats(username: str = Depends(get_current_user)):
+    return get_pool().stats()
+
 @app.get("/websites")
-async def list_websites(username: str = Depends(get_current_user)):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM websites")
-    websites = cur.fetchall()
-    cur.close()
-    conn.close()
-    return [dict(w) for w in websites]
+async def list_websites(
+    response: Response,
+    category: Optional[str] = None,
+    page: PageParams = Depends(),
+    username: str = Depends(get_current_user),
+):
+    return await list_page(repository.websites, {"category": category}, page, response)
+
+@app.get("/websites/facets")
+async def websites_facets(username: str = Depends(get_current_user)):
+    return await repository.websites.facets()
 
 @app.post("/websites")
 async def add_website(website: Website, username: str = Depends(get_current_user)):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO websites (name, link, icon, description, category) VALUES (%s, %s, %s, %s, %s)",
-        (website.name, website.link, website.icon, website.description, website.category)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    await repository.websites.create(website.model_dump())
     return {"status": "success"}
 
 @app.put("/websites/{website_id}")
 async def update_website(website_id: int, website: Website, username: str = Depends(get_current_user)):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE websites SET name = %s, link = %s, icon = %s, description = %s, category = %s WHERE id = %s",
-        (website.name, website.link, website.icon, website.description, website.category, website_id)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    await repository.websites.update(website_id, website.model_dump())
     return {"status": "success"}
 
 @app.get("/servers")
-async def list_servers(username: str = Depends(get_current_user)):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM servers")
-    servers = cur.fetchall()
-    cur.close()
-    conn.close()
-    return [dict(s) for s in servers]
+async def list_servers(
+    response: Response,
+    client: Optional[str] = None, provider: Optional[str] = None,
+    page: PageParams = Depends(),
+    username: str = Depends(get_current_user),
+):
+    rows = await list_page(repository.servers, {"client": client, "provider": provider}, page, response)
+    # Latest background probe result; never probes inline
+    for row in rows:
+        row["health"] = health_monitor.status(row["id"])
+    return rows
+
+@app.get("/servers/health")
+async def servers_health(username: str = Depends(get_current_user)):
+    return health_monitor.stats()
+
+@app.get("/servers/{server_id}/health")
+async def server_health_history(server_id: int, username: str = Depends(get_current_user)):
+    history = health_monitor.history(server_id)
+    if history is None:
+        raise HTTPException(status_code=404, detail="Server is not monitored")
+    return {**health_monitor.status(server_id), "history": history}
+
+@app.get("/servers/facets")
+async def servers_facets(username: str = Depends(get_current_user)):
+    return await repository.servers.facets()
 
 @app.post("/servers")
 async def add_server(server: Server, username: str = Depends(get_current_user)):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO servers (server_name, provider, provider_link, client, server_ip, description) VALUES (%s, %s, %s, %s, %s, %s)",
-        (server.server_name, server.provider, server.provider_link, server.client, server.server_ip, server.description)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    await repository.servers.create(server.model_dump())
     return {"status": "success"}
 
 @app.put("/servers/{server_id}")
 async def update_server(server_id: int, server: Server, username: str = Depends(get_current_user)):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE servers SET server_name = %s, provider = %s, provider_link = %s, client = %s, server_ip = %s, description = %s WHERE id = %s",
-        (server.server_name, server.provider, server.provider_link, server.client, server.server_ip, server.description, server_id)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    await repository.servers.update(server_id, server.model_dump())
     return {"status": "success"}
 
 @app.get("/tasks")
-async def list_tasks(username: str = Depends(get_current_user)):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM tasks")
-    tasks = cur.fetchall()
-    cur.close()
-    conn.close()
-    return [dict(t) for t in tasks]
+async def list_tasks(
+    response: Response,
+    category: Optional[str] = None, client: Optional[str] = None, status: Optional[str] = None,
+    page: PageParams = Depends(),
+    username: str = Depends(get_current_user),
+):
+    return await list_page(repository.tasks, {"category": category, "client": client, "status": status}, page, response)
+
+@app.get("/tasks/facets")
+async def tasks_facets(username: str = Depends(get_current_user)):
+    return await repository.tasks.facets()
 
 @app.post("/tasks")
 async def add_task(task: Task, username: str = Depends(get_current_user)):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO tasks (task_name, category, client, status, date_created, date_completed) VALUES (%s, %s, %s, %s, %s, %s)",
-        (task.task_name, task.category, task.client, task.status, task.date_created, task.date_completed)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    await repository.tasks.create(task.model_dump())
     return {"status": "success"}
 
 @app.put("/tasks/{task_id}")
 async def update_task(task_id: int, task: Task, username: str = Depends(get_current_user)):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE tasks SET task_name = %s, category = %s, client = %s, status = %s, date_created = %s, date_completed = %s WHERE id = %s",
-        (task.task_name, task.category, task.client, task.status, task.date_created, task.date_completed, task_id)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    await repository.tasks.update(task_id, task.model_dump())
     return {"status": "success"}
 
 @app.get("/notes")
-async def list_notes(username: str = Depends(get_current_user)):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM notes")
-    notes = cur.fetchall()
-    cur.close()
-    conn.close()
-    return [dict(n) for n in notes]
+async def list_notes(
+    response: Response,
+    tag: Optional[str] = None,
+    page: PageParams = Depends(),
+    username: str = Depends(get_current_user),
+):
+    return await list_page(repository.notes, {"tag": tag}, page, response)
+
+@app.get("/notes/facets")
+async def notes_facets(username: str = Depends(get_current_user)):
+    return await repository.notes.facets()
+
+@app.get("/notes/search")
+async def search_notes(
+    q: str = Query(..., min_length=1),
+    tag: Optional[str] = None,
+    limit: int = Query(repository.SEARCH_PAGE_SIZE, ge=1, le=repository.MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    username: str = Depends(get_current_user),
+):
+    return await repository.notes.search(q, tag, limit, offset)
 
 @app.post("/notes")
 async def add_note(note: Note, username: str = Depends(get_current_user)):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO notes (content, tags, ref_link, images, date_created) VALUES (%s, %s, %s, %s, %s)",
-        (note.content, note.tags, note.ref_link, note.images, note.date_created)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    await repository.notes.create(note.model_dump())
     return {"status": "success"}
 
 @app.put("/notes/{note_id}")
 async def update_note(note_id: int, note: Note, username: str = Depends(get_current_user)):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE notes SET content = %s, tags = %s, ref_link = %s, images = %s, date_created = %s WHERE id = %s",
-        (note.content, note.tags, note.ref_link, note.images, note.date_created, note_id)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    await repository.notes.update(note_id, note.model_dump())
     return {"status": "success"}
 
+# --- Bulk import / export ---
+BULK_RESOURCES = {
+    "websites": (repository.websites, Website),
+    "servers": (repository.servers, Server),
+    "tasks": (repository.tasks, Task),
+    "notes": (repository.notes, Note),
+}
+
+def get_bulk_resource(resource: str):
+    if resource not in BULK_RESOURCES:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return BULK_RESOURCES[resource]
+
+def row_validator(model):
+    def validate(record: dict) -> dict:
+        try:
+            return model.model_validate(record).model_dump()
+        except ValidationError as e:
+            raise ValueError("; ".join(
+                f"{'.'.join(str(part) for part in err['loc']) or 'row'}: {err['msg']}" for err in e.errors()
+            ))
+    return validate
+
+@app.post("/{resource}/import")
+async def bulk_import(
+    resource: str,
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, description="csv or ndjson; guessed from the file name when omitted"),
+    atomic: bool = Query(False, description="Import nothing if any row fails validation"),
+    username: str = Depends(get_current_user),
+):
+    """Insert every valid row of a CSV/NDJSON upload in one transaction; bad rows are reported by line."""
+    repo, model = get_bulk_resource(resource)
+    started = time.perf_counter()
+    try:
+        fmt = bulk.detect_format(format, file.filename, file.content_type)
+        result = await repo.bulk_import(bulk.read_records(file.file, fmt), row_validator(model), atomic)
+    except bulk.InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**result, "format": fmt, "ms": round((time.perf_counter() - started) * 1000, 1)}
+
+@app.get("/{resource}/export")
+async def bulk_export(
+    resource: str,
+    request: Request,
+    format: str = Query("ndjson", pattern="^(csv|ndjson)$"),
+    username: str = Depends(get_current_user),
+):
+    """Stream the whole table (or the rows matching the list filters) in id order."""
+    repo, _ = get_bulk_resource(resource)
+    filters = {k: v for k, v in request.query_params.items() if k != "format"}
+    columns = ("id",) + repo.columns
+    batches = repo.export(filters)
+    try:
+        # Pull the first batch here so bad filters become a 400 rather than a broken stream
+        first = await anext(batches, [])
+    except repository.InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except repository.ExportBusy as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+
+    async def body():
+        try:
+            yield bulk.format_rows(first, columns, format, header=True)
+            async for rows in batches:
+                yield bulk.format_rows(rows, columns, format)
+        finally:
+            await batches.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type=bulk.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{resource}.{format}"'},
+    )
+
+# --- Change feed ---
+def change_tables(tables: Optional[str]) -> Optional[list]:
+    if not tables:
+        return None
+    names = [t.strip() for t in tables.split(",") if t.strip()]
+    unknown = [t for t in names if t not in BULK_RESOURCES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tables: {', '.join(unknown)}")
+    return names
+
+@app.get("/changes")
+async def list_changes(
+    since: int = Query(0, ge=0, description="Last version the client has applied"),
+    limit: int = Query(repository.CHANGES_PAGE_SIZE, ge=1, le=repository.CHANGES_PAGE_SIZE),
+    tables: Optional[str] = Query(None, description="Comma-separated table names"),
+    username: str = Depends(get_current_user),
+):
+    """Row-level changes after ``since``; pass the returned ``version`` next time.
+
+    ``reset`` means changes were purged since then and the client should reload its copy.
+    """
+    return await repository.changes.since(since, limit, change_tables(tables))
+
+def change_event(change: dict) -> str:
+    return f"id: {change['version']}\nevent: change\ndata: {json.dumps({'type': 'change', **change})}\n\n"
+
+@app.get("/changes/stream")
+async def stream_changes(
+    since: Optional[int] = Query(None, ge=0, description="Replay changes after this version first"),
+    tables: Optional[str] = Query(None),
+    last_event_id: Optional[str] = Header(None),
+    username: str = Depends(get_current_user),
+):
+    """Server-Sent Events: ``ready``, then ``change`` events as rows are written.
+
+    Each event's SSE id is its version, so a reconnecting client resumes via
+    Last-Event-ID. A ``reset`` event means events were lost and the client
+    should reload before reconnecting.
+    """
+    names = change_tables(tables)
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    # Subscribe before reading the backlog so nothing falls in between; overlap is skipped by version
+    queue = change_feed.subscribe()
+    version = change_feed.version if since is None else since
+
+    async def events():
+        nonlocal version
+        try:
+            yield f"event: ready\ndata: {json.dumps({'type': 'ready', 'version': version})}\n\n"
+            if since is not None:
+                while True:
+                    page = await repository.changes.since(version, tables=names)
+                    if page["reset"]:
+                        yield f"event: reset\ndata: {json.dumps({'type': 'reset', 'version': page['latest']})}\n\n"
+                        return
+                    for change in page["changes"]:
+                        yield change_event(change)
+                    version = page["version"]
+                    if not page["more"]:
+                        break
+            deadline = time.monotonic() + CHANGES_STREAM_MAX_AGE
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    change = await asyncio.wait_for(queue.get(), min(CHANGES_HEARTBEAT, remaining))
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if change is None:
+                    yield f"event: reset\ndata: {json.dumps({'type': 'reset', 'version': change_feed.version})}\n\n"
+                    return
+                if change["version"] <= version or (names and change["table"] not in names):
+                    continue
+                version = change["version"]
+                yield change_event(change)
+        finally:
+            change_feed.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/changes/stats")
+async def change_feed_stats(username: str = Depends(get_current_user)):
+    return change_feed.stats()
+
+# --- Attachments ---
+def _store_upload(fileobj) -> dict:
+    with attachment_store.open_writer() as writer:
+        while chunk := fileobj.read(CHUNK_SIZE):
+            writer.write(chunk)
+        # The type comes from the bytes, never from the client's header
+        content_type = writer.image_type
+        if content_type is None:
+            raise UnsupportedAttachment("Only PNG, JPEG, GIF, WebP and BMP images can be uploaded")
+        attachment_id = writer.commit(content_type)
+        return {"id": attachment_id, "size": writer.size, "content_type": content_type}
+
+@app.post("/attachments")
+async def upload_attachment(file: UploadFile = File(...), username: str = Depends(get_current_user)):
+    try:
+        return await run_in_threadpool(_store_upload, file.file)
+    except AttachmentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedAttachment as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+# Not behind auth so <img> tags can load it: IDs are SHA-256 digests of the content and not guessable
+@app.get("/attachments/{attachment_id}")
+async def download_attachment(attachment_id: str, if_none_match: Optional[str] = Header(None)):
+    if not attachment_store.is_valid_id(attachment_id):
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    etag = f'"{attachment_id}"'
+    # Content-addressed, so the bytes behind an ID never change
+    cache_headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        # Served from the app's origin: never let a browser render it as a document
+        "X-Content-Type-Options": "nosniff",
+        "Content-Security-Policy": "sandbox",
+    }
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=cache_headers)
+    meta = await repository.run_in_db(attachment_store.get_metadata, attachment_id)
+    path = attachment_store.path_for(attachment_id)
+    if not meta or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    if meta["content_type"] in IMAGE_TYPES:
+        return FileResponse(path, media_type=meta["content_type"], headers=cache_headers)
+    # Older rows kept whatever type the client sent; anything that is not an image is download-only
+    return FileResponse(path, media_type="application/octet-stream", headers=cache_headers,
+                        filename=f"attachment-{attachment_id[:12]}", content_disposition_type="attachment")
+
 
 # Serve React build in production
 if os.path.exists("frontend/dist"):
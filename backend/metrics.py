@@ -0,0 +1,309 @@
+"""Prometheus metrics, rendered in the text exposition format at /metrics.
+
+Counters and histograms are plain Python numbers bumped without locks:
+everything that records them runs on the event loop, so the hot path is
+a dict lookup and an add. Histograms are pre-bucketed and store one count
+per bucket; the cumulative ``le`` series is only built when scraped.
+Callback gauges read their value from a function at scrape time, so
+queue depths and pool sizes cost nothing between scrapes.
+
+Label values are capped per metric (METRICS_MAX_SERIES): once a metric
+has that many label sets, new ones are folded into a single ``__other__``
+series instead of growing without bound (e.g. one per called host).
+"""
+import math
+import os
+import time
+from bisect import bisect_left
+
+METRICS_MAX_SERIES = int(os.getenv("METRICS_MAX_SERIES", "500"))
+
+# Seconds; tuned for HTTP handlers, upstream calls and DB queries
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OVERFLOW_LABEL = "__other__"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Child series for these label values, created on first use."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            if len(self._children) >= METRICS_MAX_SERIES:
+                values = (OVERFLOW_LABEL,) * len(self.labelnames)
+                child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+        return child
+
+    def _samples(self):
+        """(suffix, label text, value) for every series."""
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._children[()].value += amount
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield "", _label_text(self.labelnames, values), child.value
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount=1):
+        self._children[()].value -= amount
+
+    def set(self, value):
+        self._children[()].value = value
+
+
+class CallbackGauge(_Metric):
+    """Gauge read from ``fn()`` at scrape time.
+
+    ``fn`` returns a number, or with labelnames a dict mapping label value
+    tuples to numbers. A failing callback drops its series from that scrape.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, fn, labelnames: tuple = ()):
+        self.fn = fn
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return None
+
+    def _samples(self):
+        try:
+            values = self.fn()
+        except Exception:
+            return
+        if values is None:
+            return
+        if not self.labelnames:
+            values = {(): values}
+        for label_values, value in values.items():
+            yield "", _label_text(self.labelnames, label_values), value
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        # One slot per bound plus the +Inf overflow
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            counts, cumulative = list(child.counts), 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                yield "_bucket", _label_text(self.labelnames, values, le), cumulative
+            labels = _label_text(self.labelnames, values)
+            yield "_sum", labels, child.sum
+            yield "_count", labels, child.count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback_gauge(self, name, documentation, fn, labelnames=()) -> CallbackGauge:
+        return self.register(CallbackGauge(name, documentation, fn, labelnames))
+
+    def unregister(self, name: str):
+        self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- HTTP ---
+http_requests_in_flight = REGISTRY.gauge(
+    "http_requests_in_flight", "Requests currently being served", ("method",))
+http_requests_total = REGISTRY.counter(
+    "http_requests_total", "Requests served, by route template and status", ("method", "route", "status"))
+http_request_duration = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time to the end of the response body", ("method", "route"))
+
+# --- Upstreams ---
+api_calls_total = REGISTRY.counter(
+    "api_calls_total", "ApiCaller requests by host and status (0 for transport errors)", ("host", "status"))
+api_call_duration = REGISTRY.histogram(
+    "api_call_duration_seconds", "ApiCaller request time, including reading the body", ("host",))
+ai_requests_total = REGISTRY.counter(
+    "ai_requests_total", "AI provider calls (cache hits excluded)", ("provider", "model", "outcome"))
+ai_request_duration = REGISTRY.histogram(
+    "ai_request_duration_seconds", "AI provider call time, to the last token when streaming", ("provider", "model"),
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120))
+ai_tokens_total = REGISTRY.counter(
+    "ai_tokens_total", "Tokens reported by AI providers", ("provider", "model", "direction"))
+
+# --- Code runs ---
+code_runs_total = REGISTRY.counter(
+    "code_runs_total", "Finished code run jobs by status and failure reason", ("status", "reason"))
+code_run_queue_duration = REGISTRY.histogram(
+    "code_run_queue_seconds", "Time a code run waited for a slot")
+code_run_duration = REGISTRY.histogram(
+    "code_run_duration_seconds", "Time a code run held its slot")
+
+# --- Server health probes ---
+health_probes_total = REGISTRY.counter(
+    "health_probes_total", "Background server probes by kind (tcp/http) and result", ("kind", "result"))
+health_probe_duration = REGISTRY.histogram(
+    "health_probe_duration_seconds", "Server probe time, including failures and timeouts", ("kind",))
+
+# --- Database ---
+db_call_duration = REGISTRY.histogram(
+    "db_call_duration_seconds", "Repository call time on the DB executor, by operation", ("operation",))
+db_executor_wait = REGISTRY.histogram(
+    "db_executor_wait_seconds", "Time a repository call waited for a DB executor thread")
+# Observed from DB executor threads, under the pool's own lock
+db_pool_acquire = REGISTRY.histogram(
+    "db_pool_acquire_seconds", "Time spent waiting for a pooled connection")
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording in-flight requests, status codes and latency per route.
+
+    Pure ASGI rather than BaseHTTPMiddleware so streaming responses pass
+    through untouched. The route label is the matched path template
+    (``/run-code/jobs/{job_id}``), read from the scope after routing, so
+    IDs do not create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        in_flight = http_requests_in_flight.labels(method)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            in_flight.dec()
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            http_requests_total.labels(method, route, str(status)).inc()
+            http_request_duration.labels(method, route).observe(duration)
@@ -0,0 +1,227 @@
+"""Versioned schema migrations.
+
+Steps run once, in order, and each applied version is recorded in
+``schema_version``. Workers booting together serialize on an advisory
+lock; whoever gets it second finds nothing left to apply. Add new steps
+to the end of MIGRATIONS and never edit one that has shipped.
+
+The early steps use IF NOT EXISTS, so databases created before
+versioning was added adopt the history without changes.
+"""
+import time
+
+from backend.attachments import AttachmentStore, migrate_note_images
+from backend.database import db_cursor
+
+# Arbitrary app-wide key for pg_advisory_xact_lock
+MIGRATION_LOCK_ID = 72_650_019
+
+
+def _initial_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS websites (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            link TEXT NOT NULL,
+            icon TEXT,
+            description TEXT,
+            category TEXT DEFAULT 'General'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS servers (
+            id SERIAL PRIMARY KEY,
+            server_name TEXT NOT NULL,
+            provider TEXT,
+            provider_link TEXT,
+            client TEXT,
+            server_ip TEXT,
+            description TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id SERIAL PRIMARY KEY,
+            task_name TEXT NOT NULL,
+            category TEXT,
+            client TEXT,
+            status TEXT DEFAULT 'Pending',
+            date_created TEXT,
+            date_completed TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notes (
+            id SERIAL PRIMARY KEY,
+            content TEXT NOT NULL,
+            tags TEXT,
+            ref_link TEXT,
+            images TEXT,
+            date_created TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            hashed_password TEXT NOT NULL
+        )
+    ''')
+
+
+# (table, filter columns, sortable columns) -- mirrors the repositories in backend/repository.py
+_LIST_INDEXES = [
+    ("websites", ("category",), ("name", "category")),
+    ("servers", ("client", "provider"), ("server_name", "client", "provider")),
+    ("tasks", ("category", "client", "status"), ("task_name", "status", "date_created", "date_completed")),
+    ("notes", (), ("date_created",)),
+]
+
+
+def _list_indexes(cursor):
+    for table, filter_columns, sort_columns in _LIST_INDEXES:
+        # Equality filter + default id ordering
+        for column in filter_columns:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_{column}_id ON {table} ({column}, id)"
+            )
+        # Keyset pagination over (COALESCE(column, ''), id)
+        for column in sort_columns:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_sort_{column} ON {table} ((COALESCE({column}, '')), id)"
+            )
+
+
+def _attachments(cursor):
+    # Blobs live in the content-addressed store, see backend/attachments.py
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attachments (
+            id TEXT PRIMARY KEY,
+            content_type TEXT NOT NULL,
+            size BIGINT NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT now()
+        )
+    ''')
+
+
+def _note_tags(cursor):
+    # Normalized note tags, kept in sync by repository.NoteRepository
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS note_tags (
+            note_id INTEGER NOT NULL REFERENCES notes(id) ON DELETE CASCADE,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (note_id, tag)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_note_tags_tag ON note_tags (tag, note_id)")
+    # Backfill note_tags for notes written before the table existed
+    cursor.execute('''
+        INSERT INTO note_tags (note_id, tag)
+        SELECT DISTINCT n.id, trim(t.tag)
+        FROM notes n, unnest(string_to_array(n.tags, ',')) AS t(tag)
+        WHERE trim(t.tag) <> ''
+          AND NOT EXISTS (SELECT 1 FROM note_tags nt WHERE nt.note_id = n.id)
+        ON CONFLICT DO NOTHING
+    ''')
+
+
+def _notes_search(cursor):
+    # Text search config must match repository.SEARCH_CONFIG
+    cursor.execute('''
+        ALTER TABLE notes ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', COALESCE(content, ''))) STORED
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_search ON notes USING GIN (search_vector)")
+
+
+def _ai_cache(cursor):
+    # Persisted AI responses, see backend/ai_cache.py (enabled by AI_CACHE_PERSIST)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_cache (
+            key TEXT PRIMARY KEY,
+            response JSONB NOT NULL,
+            expires_at TIMESTAMPTZ NOT NULL
+        )
+    ''')
+
+
+def _change_log(cursor):
+    # Row-level change feed, see backend/changes.py. Writers append entries with no
+    # version; repository.ChangeLogRepository numbers committed ones in seq order
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+            version BIGINT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            data JSONB NOT NULL,
+            changed_at TIMESTAMPTZ DEFAULT now()
+        )
+    ''')
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_change_log_version ON change_log (version)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_log_table ON change_log (table_name, version)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_log_pending ON change_log (seq) WHERE version IS NULL")
+
+
+def _note_images(cursor):
+    # Notes used to embed images as base64 data URLs; they now reference attachment ids
+    migrate_note_images(cursor, AttachmentStore())
+
+
+MIGRATIONS = [
+    (1, "Initial tables", _initial_tables),
+    (2, "List filter and keyset pagination indexes", _list_indexes),
+    (3, "Attachments metadata", _attachments),
+    (4, "Normalized note tags", _note_tags),
+    (5, "Notes full-text search", _notes_search),
+    (6, "Persisted AI response cache", _ai_cache),
+    (7, "Change log for the change feed", _change_log),
+    (8, "Move inline note images to the attachment store", _note_images),
+]
+
+
+def _current_version(cursor) -> int:
+    cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL AS present")
+    if not cursor.fetchone()["present"]:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version")
+    return cursor.fetchone()["version"]
+
+
+def migrate() -> dict:
+    """Apply pending migrations; returns the schema version and what was applied, with timings."""
+    start = time.perf_counter()
+    latest = MIGRATIONS[-1][0]
+    with db_cursor() as cur:
+        version = _current_version(cur)
+
+    applied = []
+    if version < latest:
+        # One transaction: the lock is held until commit, and a failing step rolls back every step
+        with db_cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ DEFAULT now(),
+                    duration_ms REAL
+                )
+            ''')
+            # Re-read under the lock: another worker may have migrated while we waited
+            version = _current_version(cur)
+            for number, description, step in MIGRATIONS:
+                if number <= version:
+                    continue
+                step_start = time.perf_counter()
+                step(cur)
+                duration_ms = round((time.perf_counter() - step_start) * 1000, 1)
+                cur.execute(
+                    "INSERT INTO schema_version (version, description, duration_ms) VALUES (%s, %s, %s)",
+                    (number, description, duration_ms),
+                )
+                applied.append({"version": number, "description": description, "ms": duration_ms})
+                version = number
+
+    return {"version": version, "applied": applied, "ms": round((time.perf_counter() - start) * 1000, 1)}
@@ -0,0 +1,549 @@
+import asyncio
+import base64
+import functools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from psycopg2.extras import Json, execute_values
+
+from backend.bulk import EXPORT_BATCH_SIZE, EXPORT_MAX_CONCURRENT, IMPORT_BATCH_SIZE, IMPORT_MAX_ERRORS
+from backend.database import DB_POOL_MAX, connect, db_cursor, get_pool
+from backend.metrics import db_call_duration, db_executor_wait
+
+# One worker per pooled connection: more threads would only queue on the pool
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_POOL_MAX)))
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+SEARCH_PAGE_SIZE = 20
+# Must match the text search config of notes.search_vector in backend/migrations.py
+SEARCH_CONFIG = "english"
+# Writes to the resource tables append to change_log and NOTIFY this channel (backend/changes.py listens)
+CHANGES_CHANNEL = "table_changes"
+# Serializes the numbering of committed change_log entries (writers never take it)
+CHANGE_LOG_LOCK_ID = 72_650_023
+CHANGES_PAGE_SIZE = 1000
+
+_executor = None
+_export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+    return _executor
+
+
+def _operation_name(fn) -> str:
+    # "websites.list" for repository methods, the function name otherwise
+    owner = getattr(fn, "__self__", None)
+    name = fn.__name__.lstrip("_")
+    if owner is None:
+        return name
+    return f"{getattr(owner, 'table', type(owner).__name__)}.{name}"
+
+
+async def run_in_db(fn, *args, **kwargs):
+    """Run a blocking database callable on the bounded DB executor."""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(fn, *args, **kwargs)
+    started = None
+
+    def timed():
+        nonlocal started
+        started = time.perf_counter()
+        return call()
+
+    submitted = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_get_executor(), timed)
+    finally:
+        # Recorded back on the event loop, like every other metric
+        if started is not None:
+            db_executor_wait.observe(started - submitted)
+            db_call_duration.labels(_operation_name(fn)).observe(time.perf_counter() - started)
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+class ExportBusy(Exception):
+    pass
+
+
+def encode_cursor(sort_value, row_id: int) -> str:
+    raw = json.dumps([sort_value, row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        raise InvalidQuery("Malformed cursor")
+
+
+class TableRepository:
+    """Async CRUD for one of the simple resource tables.
+
+    ``filters`` maps query parameter names to SQL conditions taking one
+    parameter; ``sortable`` lists the text columns clients may order by.
+    Listing uses keyset pagination on (sort column, id).
+    """
+
+    def __init__(self, table: str, columns: tuple, filters: dict = None, sortable: tuple = ()):
+        self.table = table
+        self.columns = columns
+        self.filters = filters or {}
+        self.sortable = sortable
+        # Explicit column list so derived columns (e.g. search vectors) stay out of responses
+        self.select_list = ", ".join(("id",) + columns)
+
+    def _conditions(self, filters: dict = None):
+        conditions, params = [], []
+        for name, value in (filters or {}).items():
+            if value is None:
+                continue
+            if name not in self.filters:
+                raise InvalidQuery(f"Cannot filter {self.table} by {name!r}")
+            conditions.append(self.filters[name])
+            params.append(value)
+        return conditions, params
+
+    def _list(self, filters: dict = None, sort: str = None,
+              limit: int = DEFAULT_PAGE_SIZE, cursor: str = None):
+        sort = sort or "id"
+        descending = sort.startswith("-")
+        column = sort.lstrip("-")
+        if column != "id" and column not in self.sortable:
+            raise InvalidQuery(f"Cannot sort {self.table} by {column!r}")
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        conditions, params = self._conditions(filters)
+        # NULLs would drop out of row comparisons, so sort on the coalesced value
+        key = "id" if column == "id" else f"COALESCE({column}, '')"
+        direction, op = ("DESC", "<") if descending else ("ASC", ">")
+        if cursor:
+            sort_value, last_id = decode_cursor(cursor)
+            if column == "id":
+                conditions.append(f"id {op} %s")
+                params.append(last_id)
+            else:
+                conditions.append(f"({key}, id) {op} (%s, %s)")
+                params.extend([sort_value, last_id])
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = f"id {direction}" if column == "id" else f"{key} {direction}, id {direction}"
+        with db_cursor() as cur:
+            cur.execute(
+                f"SELECT {self.select_list} FROM {self.table} {where} ORDER BY {order} LIMIT %s",
+                params + [limit + 1],
+            )
+            rows = [dict(row) for row in cur.fetchall()]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(
+                None if column == "id" else (last[column] or ""), last["id"]
+            )
+        return rows, next_cursor
+
+    def _facets(self) -> dict:
+        facets = {}
+        with db_cursor() as cur:
+            for name in self.filters:
+                if name not in self.columns:
+                    continue
+                cur.execute(f"SELECT DISTINCT {name} FROM {self.table} WHERE {name} IS NOT NULL ORDER BY {name}")
+                facets[name] = [row[name] for row in cur.fetchall()]
+        return facets
+
+    def _create(self, values: dict) -> dict:
+        placeholders = ", ".join(["%s"] * len(self.columns))
+        with db_cursor() as cur:
+            cur.execute(
+                f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES ({placeholders}) RETURNING {self.select_list}",
+                [values.get(c) for c in self.columns],
+            )
+            row = dict(cur.fetchone())
+            self._after_write(cur, row["id"], values)
+            self._log_changes(cur, "insert", [row])
+            return row
+
+    def _update(self, row_id: int, values: dict) -> bool:
+        assignments = ", ".join(f"{c} = %s" for c in self.columns)
+        with db_cursor() as cur:
+            cur.execute(
+                f"UPDATE {self.table} SET {assignments} WHERE id = %s RETURNING {self.select_list}",
+                [values.get(c) for c in self.columns] + [row_id],
+            )
+            row = cur.fetchone()
+            if row is None:
+                return False
+            self._after_write(cur, row_id, values)
+            self._log_changes(cur, "update", [dict(row)])
+            return True
+
+    def _after_write(self, cur, row_id: int, values: dict):
+        """Hook run inside the write transaction to maintain derived tables."""
+
+    def _after_insert_many(self, cur, row_ids: list, rows: list):
+        """Bulk counterpart of _after_write; override with a batched version where it matters."""
+        for row_id, values in zip(row_ids, rows):
+            self._after_write(cur, row_id, values)
+
+    def _insert_many(self, cur, rows: list) -> int:
+        inserted = execute_values(
+            cur,
+            f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES %s RETURNING {self.select_list}",
+            [[values.get(c) for c in self.columns] for values in rows],
+            page_size=len(rows),
+            fetch=True,
+        )
+        inserted = [dict(row) for row in inserted]
+        self._after_insert_many(cur, [row["id"] for row in inserted], rows)
+        self._log_changes(cur, "insert", inserted)
+        return len(inserted)
+
+    def _log_changes(self, cur, op: str, rows: list):
+        """Append rows to change_log and notify listeners; both take effect on commit.
+
+        Entries go in unnumbered, so concurrent writers do not wait on each
+        other; ChangeLogRepository gives them versions once committed.
+        """
+        execute_values(
+            cur,
+            "INSERT INTO change_log (table_name, row_id, op, data) VALUES %s",
+            [(self.table, row["id"], op, Json(row)) for row in rows],
+            page_size=1000,
+        )
+        cur.execute("SELECT pg_notify(%s, %s)", (CHANGES_CHANNEL, self.table))
+
+    def _import(self, records, validate, atomic: bool = False) -> dict:
+        """Insert ``(line, record)`` pairs in multi-row batches within one transaction.
+
+        ``validate`` turns a raw record into column values or raises
+        ValueError; failing rows are skipped and reported by line. With
+        ``atomic`` any failure rolls the whole import back.
+        """
+        imported, failed, errors, batch = 0, 0, [], []
+        with db_cursor() as cur:
+            for line, record in records:
+                try:
+                    if isinstance(record, Exception):
+                        raise record
+                    batch.append(validate(record))
+                except ValueError as e:
+                    failed += 1
+                    if len(errors) < IMPORT_MAX_ERRORS:
+                        errors.append({"line": line, "error": str(e)})
+                    continue
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    # Atomic imports stop writing after the first bad row but keep validating
+                    if not (atomic and failed):
+                        imported += self._insert_many(cur, batch)
+                    batch = []
+            if batch and not (atomic and failed):
+                imported += self._insert_many(cur, batch)
+            rolled_back = atomic and failed > 0
+            if rolled_back:
+                cur.connection.rollback()
+                imported = 0
+        return {
+            "imported": imported,
+            "failed": failed,
+            "errors": errors,
+            "errors_truncated": failed > len(errors),
+            "rolled_back": rolled_back,
+        }
+
+    def _export_open(self, filters: dict = None):
+        conditions, params = self._conditions(filters)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        if not _export_slots.acquire(blocking=False):
+            raise ExportBusy(f"{EXPORT_MAX_CONCURRENT} exports are already running; try again shortly")
+        conn = None
+        try:
+            # Not pooled: a slow download would otherwise hold a pool connection throughout
+            conn = connect()
+            # Named cursor: rows stay on the server and come over a batch per fetch
+            cur = conn.cursor(name=f"export_{self.table}")
+            cur.execute(f"SELECT {self.select_list} FROM {self.table} {where} ORDER BY id", params)
+        except Exception:
+            if conn is not None:
+                conn.close()
+            _export_slots.release()
+            raise
+        return conn, cur
+
+    def _export_fetch(self, cur, size: int, lock) -> list:
+        with lock:
+            return [dict(row) for row in cur.fetchmany(size)]
+
+    def _export_close(self, conn, cur, lock):
+        # Waits for a fetch still running after its request was cancelled
+        with lock:
+            try:
+                cur.close()
+            except psycopg2.Error:
+                pass
+            finally:
+                conn.close()
+                _export_slots.release()
+
+    async def list(self, filters: dict = None, sort: str = None,
+                   limit: int = DEFAULT_PAGE_SIZE, cursor: str = None):
+        """Return ``(rows, next_cursor)``; ``next_cursor`` is None on the last page."""
+        return await run_in_db(self._list, filters, sort, limit, cursor)
+
+    async def facets(self) -> dict:
+        return await run_in_db(self._facets)
+
+    async def create(self, values: dict) -> dict:
+        return await run_in_db(self._create, values)
+
+    async def update(self, row_id: int, values: dict) -> bool:
+        return await run_in_db(self._update, row_id, values)
+
+    async def bulk_import(self, records, validate, atomic: bool = False) -> dict:
+        return await run_in_db(self._import, records, validate, atomic)
+
+    async def export(self, filters: dict = None, batch_size: int = EXPORT_BATCH_SIZE):
+        """Yield lists of rows in id order from a server-side cursor.
+
+        Holds its own connection (not a pooled one) until the generator
+        finishes or is closed; raises ExportBusy past EXPORT_MAX_CONCURRENT.
+        """
+        conn, cur = await run_in_db(self._export_open, filters)
+        # Cursors are not thread-safe, and a disconnect cancels the await but not the fetch itself
+        lock = threading.Lock()
+        try:
+            while rows := await run_in_db(self._export_fetch, cur, batch_size, lock):
+                yield rows
+        finally:
+            # Not awaited: on client disconnect this runs inside a cancelled task
+            _get_executor().submit(self._export_close, conn, cur, lock)
+
+
+class UserRepository:
+    table = "users"
+
+    def _get_by_username(self, username: str):
+        with db_cursor() as cur:
+            cur.execute("SELECT * FROM users WHERE username = %s", (username,))
+            row = cur.fetchone()
+            return dict(row) if row else None
+
+    def _create(self, username: str, hashed_password: str):
+        with db_cursor() as cur:
+            cur.execute(
+                "INSERT INTO users (username, hashed_password) VALUES (%s, %s) RETURNING id",
+                (username, hashed_password),
+            )
+            return cur.fetchone()["id"]
+
+    def _update_password(self, username: str, hashed_password: str):
+        with db_cursor() as cur:
+            cur.execute("UPDATE users SET hashed_password = %s WHERE username = %s", (hashed_password, username))
+
+    async def get_by_username(self, username: str):
+        return await run_in_db(self._get_by_username, username)
+
+    async def create(self, username: str, hashed_password: str):
+        return await run_in_db(self._create, username, hashed_password)
+
+    async def update_password(self, username: str, hashed_password: str):
+        await run_in_db(self._update_password, username, hashed_password)
+
+
+def split_tags(tags) -> list:
+    """Normalize the comma-separated notes.tags string the way the dashboard displays it."""
+    seen = []
+    for tag in (tags or "").split(","):
+        tag = tag.strip()
+        if tag and tag not in seen:
+            seen.append(tag)
+    return seen
+
+
+class NoteRepository(TableRepository):
+    """Notes plus the note_tags lookup table and full-text search."""
+
+    def _after_write(self, cur, row_id: int, values: dict):
+        cur.execute("DELETE FROM note_tags WHERE note_id = %s", (row_id,))
+        tags = split_tags(values.get("tags"))
+        if tags:
+            cur.executemany(
+                "INSERT INTO note_tags (note_id, tag) VALUES (%s, %s)",
+                [(row_id, tag) for tag in tags],
+            )
+
+    def _after_insert_many(self, cur, row_ids: list, rows: list):
+        pairs = [(row_id, tag) for row_id, values in zip(row_ids, rows) for tag in split_tags(values.get("tags"))]
+        if pairs:
+            execute_values(cur, "INSERT INTO note_tags (note_id, tag) VALUES %s", pairs, page_size=len(pairs))
+
+    def _facets(self) -> dict:
+        with db_cursor() as cur:
+            cur.execute("SELECT DISTINCT tag FROM note_tags ORDER BY tag")
+            return {"tag": [row["tag"] for row in cur.fetchall()]}
+
+    def _search(self, query: str, tag: str = None, limit: int = SEARCH_PAGE_SIZE, offset: int = 0) -> dict:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        tag_condition = "AND n.id IN (SELECT note_id FROM note_tags WHERE tag = %(tag)s)" if tag else ""
+        columns = ", ".join(f"n.{c}" for c in ("id",) + self.columns)
+        # Rank and page on the GIN-matched set first; ts_headline only runs for the returned page
+        with db_cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT {columns}, hits.rank,
+                       ts_headline(%(config)s, n.content, hits.query,
+                                   'MaxFragments=2, MaxWords=18, MinWords=6, StartSel=<mark>, StopSel=</mark>') AS snippet
+                FROM (
+                    SELECT n.id, ts_rank_cd(n.search_vector, q) AS rank, q AS query
+                    FROM notes n, websearch_to_tsquery(%(config)s, %(query)s) q
+                    WHERE n.search_vector @@ q {tag_condition}
+                    ORDER BY rank DESC, n.id DESC
+                    LIMIT %(limit)s OFFSET %(offset)s
+                ) hits
+                JOIN notes n ON n.id = hits.id
+                ORDER BY hits.rank DESC, n.id DESC
+                """,
+                {"config": SEARCH_CONFIG, "query": query, "tag": tag, "limit": limit + 1, "offset": offset},
+            )
+            hits = [dict(row) for row in cur.fetchall()]
+        next_offset = offset + limit if len(hits) > limit else None
+        return {"hits": hits[:limit], "next_offset": next_offset}
+
+    async def search(self, query: str, tag: str = None, limit: int = SEARCH_PAGE_SIZE, offset: int = 0) -> dict:
+        return await run_in_db(self._search, query, tag, limit, offset)
+
+
+class ChangeLogRepository:
+    """Reads the change log, numbering newly committed entries first.
+
+    Writers insert entries without a version. Whoever reads next takes
+    CHANGE_LOG_LOCK_ID and numbers every committed, unnumbered entry in
+    insertion order, continuing from the highest version. Only committed
+    entries are ever numbered, so versions stay gapless and a reader that
+    has seen version N has seen everything before it.
+    """
+    table = "change_log"
+
+    def _assign_versions(self) -> int:
+        with db_cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (CHANGE_LOG_LOCK_ID,))
+            cur.execute(
+                """
+                UPDATE change_log c SET version = numbered.version
+                FROM (
+                    SELECT seq, (SELECT COALESCE(MAX(version), 0) FROM change_log)
+                                + row_number() OVER (ORDER BY seq) AS version
+                    FROM change_log WHERE version IS NULL
+                ) numbered
+                WHERE c.seq = numbered.seq
+                """
+            )
+            return cur.rowcount
+
+    def _latest(self) -> int:
+        with db_cursor() as cur:
+            cur.execute("SELECT COALESCE(MAX(version), 0) AS version FROM change_log")
+            return cur.fetchone()["version"]
+
+    def _since(self, version: int, limit: int = CHANGES_PAGE_SIZE, tables: list = None) -> dict:
+        limit = max(1, min(limit, CHANGES_PAGE_SIZE))
+        table_condition = "AND table_name = ANY(%(tables)s)" if tables else ""
+        # Committed separately, so the lock is not held while reading
+        self._assign_versions()
+        with db_cursor() as cur:
+            cur.execute("SELECT MIN(version) AS oldest, MAX(version) AS latest FROM change_log")
+            bounds = cur.fetchone()
+            # Versions are gapless, so a hole before the oldest kept entry means it was purged
+            if bounds["oldest"] is not None and version < bounds["oldest"] - 1:
+                return {"changes": [], "version": bounds["latest"], "latest": bounds["latest"],
+                        "more": False, "reset": True}
+            cur.execute(
+                f"""
+                SELECT version, table_name, row_id, op, data, changed_at FROM change_log
+                WHERE version > %(version)s {table_condition}
+                ORDER BY version LIMIT %(limit)s
+                """,
+                {"version": version, "tables": tables, "limit": limit + 1},
+            )
+            rows = cur.fetchall()
+        more = len(rows) > limit
+        changes = [
+            {"version": row["version"], "table": row["table_name"], "id": row["row_id"], "op": row["op"],
+             "row": row["data"], "at": row["changed_at"].isoformat()}
+            for row in rows[:limit]
+        ]
+        latest = bounds["latest"] or 0
+        # With a table filter the last match can be well behind; a complete page covers everything up to
+        # latest (read before the page, so a match committed in between is never skipped)
+        next_version = changes[-1]["version"] if more else max([version, latest] + [c["version"] for c in changes[-1:]])
+        return {"changes": changes, "version": next_version, "latest": latest, "more": more, "reset": False}
+
+    def _purge(self, max_age_s: float) -> int:
+        with db_cursor() as cur:
+            # The newest numbered entry always stays so versions keep counting from it
+            cur.execute(
+                "DELETE FROM change_log WHERE changed_at < now() - make_interval(secs => %s) "
+                "AND version < (SELECT MAX(version) FROM change_log)",
+                (max_age_s,),
+            )
+            return cur.rowcount
+
+    async def latest(self) -> int:
+        return await run_in_db(self._latest)
+
+    async def since(self, version: int, limit: int = CHANGES_PAGE_SIZE, tables: list = None) -> dict:
+        """Changes after ``version`` in order; ``reset`` means some were purged and the client must reload."""
+        return await run_in_db(self._since, version, limit, tables)
+
+    async def purge(self, max_age_s: float) -> int:
+        return await run_in_db(self._purge, max_age_s)
+
+
+websites = TableRepository(
+    "websites",
+    ("name", "link", "icon", "description", "category"),
+    filters={"category": "category = %s"},
+    sortable=("name", "category"),
+)
+servers = TableRepository(
+    "servers",
+    ("server_name", "provider", "provider_link", "client", "server_ip", "description"),
+    filters={"client": "client = %s", "provider": "provider = %s"},
+    sortable=("server_name", "client", "provider"),
+)
+tasks = TableRepository(
+    "tasks",
+    ("task_name", "category", "client", "status", "date_created", "date_completed"),
+    filters={"category": "category = %s", "client": "client = %s", "status": "status = %s"},
+    sortable=("task_name", "status", "date_created", "date_completed"),
+)
+notes = NoteRepository(
+    "notes",
+    ("content", "tags", "ref_link", "images", "date_created"),
+    filters={"tag": "id IN (SELECT note_id FROM note_tags WHERE tag = %s)"},
+    sortable=("date_created",),
+)
+users = UserRepository()
+changes = ChangeLogRepository()
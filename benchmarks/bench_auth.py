@@ -0,0 +1,110 @@
+"""Authenticated request throughput, and how logins affect other requests.
+
+Drives the app in-process through httpx's ASGI transport:
+
+* ``/me`` throughput with the verified-token cache on and off
+* ``/me`` latency while a burst of logins runs, with bcrypt on the
+  hashing pool versus inline on the event loop (the old behaviour)
+
+Needs DATABASE_URL to point at a reachable Postgres.
+
+    python -m benchmarks.bench_auth --requests 2000 --concurrency 50 --logins 20
+"""
+import argparse
+import asyncio
+import json
+import secrets
+import statistics
+import time
+
+import bcrypt
+import httpx
+
+from backend import main as app_module
+from backend.auth import PasswordHasher, TokenCache
+from backend.migrations import migrate
+
+
+class _InlineHasher(PasswordHasher):
+    async def verify(self, password: str, hashed: str) -> bool:
+        # What the login handler used to do: bcrypt straight on the event loop
+        return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+def _percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 2),
+        "p95_ms": round(samples[int(0.95 * (len(samples) - 1))] * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2),
+    }
+
+
+async def _throughput(client, headers, requests: int, concurrency: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            assert (await client.get("/me", headers=headers)).status_code == 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {"seconds": round(elapsed, 3), "requests_per_sec": round(requests / elapsed, 1)}
+
+
+async def _latency_during_logins(client, headers, credentials, logins: int) -> dict:
+    done = asyncio.Event()
+    latencies = []
+
+    async def probe():
+        # Latency counts from when the request was due, so event loop stalls show up
+        due = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            await client.get("/me", headers=headers)
+            latencies.append(time.perf_counter() - due)
+            due = time.perf_counter() + 0.005
+
+    probe_task = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(client.post("/auth/login", data=credentials) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe_task
+    return {"logins_seconds": round(elapsed, 3), "me_during_logins": _percentiles(latencies)}
+
+
+async def main(args):
+    # The ASGI transport does not run the app lifespan
+    migrate()
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        credentials = {"username": f"bench-{secrets.token_hex(4)}", "password": secrets.token_hex(8)}
+        await client.post("/auth/register", json=credentials)
+        token = (await client.post("/auth/login", data=credentials)).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        results = {"requests": args.requests, "concurrency": args.concurrency, "logins": args.logins,
+                   "bcrypt_rounds": app_module.password_hasher.rounds}
+        results["me_token_cache"] = await _throughput(client, headers, args.requests, args.concurrency)
+        cache = app_module.token_cache
+        app_module.token_cache = TokenCache(max_entries=0)
+        results["me_no_token_cache"] = await _throughput(client, headers, args.requests, args.concurrency)
+        app_module.token_cache = cache
+
+        results["login_offloaded"] = await _latency_during_logins(client, headers, credentials, args.logins)
+        hasher = app_module.password_hasher
+        app_module.password_hasher = _InlineHasher(hasher.rounds)
+        results["login_inline"] = await _latency_during_logins(client, headers, credentials, args.logins)
+        app_module.password_hasher = hasher
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--logins", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,68 @@
+"""Compare cold-spawn runs (CodeRunner(workers=0)) with runs on the warm worker pool.
+
+Runs the same short snippet sequentially through both paths and reports
+latency percentiles, plus a concurrent burst against the pool.
+
+    python -m benchmarks.bench_code_runner --runs 50 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from backend.code_runner import CodeRunner
+
+SNIPPET = "import json, math\nprint(json.dumps({'pi': math.pi}))\n"
+
+
+def _summary(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 2),
+        "p95_ms": round(samples[int(0.95 * (len(samples) - 1))] * 1000, 2),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2),
+    }
+
+
+async def main(args):
+    runner = CodeRunner(workers=args.workers)
+    cold_runner = CodeRunner(workers=0)
+    await runner.start()
+    # Let the pool finish starting so the first warm run is not a spawn
+    await runner.run(SNIPPET)
+
+    cold = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        assert (await cold_runner.run(SNIPPET))["success"]
+        cold.append(time.perf_counter() - start)
+
+    warm = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        assert (await runner.run(SNIPPET))["success"]
+        warm.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(runner.run(SNIPPET) for _ in range(args.runs)))
+    burst = time.perf_counter() - start
+
+    results = {
+        "workers": args.workers,
+        "cold_spawn": _summary(cold),
+        "warm_pool": _summary(warm),
+        "warm_burst_runs_per_sec": round(args.runs / burst, 1),
+        "pool": runner.stats()["pool"],
+    }
+    results["p50_speedup"] = round(results["cold_spawn"]["p50_ms"] / results["warm_pool"]["p50_ms"], 1)
+    print(json.dumps(results, indent=2))
+    await runner.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,66 @@
+"""Compare blocking DB calls on the event loop with the repository executor offload.
+
+Each simulated request runs ``SELECT pg_sleep(...)`` and the script reports
+throughput for both styles. Needs DATABASE_URL to point at a reachable Postgres.
+
+    python -m benchmarks.bench_db_concurrency --requests 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from backend.database import close_pool, db_cursor, get_pool
+from backend.repository import run_in_db, shutdown_executor
+
+
+def _query(delay: float):
+    with db_cursor() as cur:
+        cur.execute("SELECT pg_sleep(%s)", (delay,))
+
+
+async def _blocking_request(delay: float):
+    # What the handlers used to do: a psycopg2 call straight inside async def
+    _query(delay)
+
+
+async def _offloaded_request(delay: float):
+    await run_in_db(_query, delay)
+
+
+async def _drive(handler, requests: int, concurrency: int, delay: float) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            await handler(delay)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {"seconds": round(elapsed, 3), "requests_per_sec": round(requests / elapsed, 1)}
+
+
+async def main(args):
+    get_pool()
+    results = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "query_delay_ms": args.delay * 1000,
+        "blocking": await _drive(_blocking_request, args.requests, args.concurrency, args.delay),
+        "offloaded": await _drive(_offloaded_request, args.requests, args.concurrency, args.delay),
+    }
+    results["speedup"] = round(
+        results["offloaded"]["requests_per_sec"] / results["blocking"]["requests_per_sec"], 2
+    )
+    print(json.dumps(results, indent=2))
+    shutdown_executor()
+    close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.01, help="server-side query time in seconds")
+    asyncio.run(main(parser.parse_args()))
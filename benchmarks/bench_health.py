@@ -0,0 +1,101 @@
+"""Background server probing against local listeners.
+
+Starts a few TCP listeners on 127.0.0.1 and points many fake servers at
+them (plus a share at a closed port, which must show as down), then runs
+HealthMonitor for a while and reports probe throughput, how late probes
+started versus their schedule, and event loop lag meanwhile. No
+database needed: the server list is handed to the monitor directly.
+
+    python -m benchmarks.bench_health --servers 2000 --interval 2 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import socket
+import statistics
+import time
+
+from backend.health import HealthMonitor
+
+
+async def _listeners(count: int) -> list:
+    async def accept(reader, writer):
+        writer.close()
+
+    return [await asyncio.start_server(accept, "127.0.0.1", 0) for _ in range(count)]
+
+
+def _closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _loop_lag(done: asyncio.Event) -> list:
+    lags = []
+    while not done.is_set():
+        due = time.perf_counter() + 0.01
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - due)
+    return lags
+
+
+async def main(args):
+    servers = await _listeners(args.listeners)
+    ports = [server.sockets[0].getsockname()[1] for server in servers]
+    closed = _closed_port()
+    targets, expect_down = {}, 0
+    for i in range(1, args.servers + 1):
+        if i % 10 == 0:
+            targets[i] = f"127.0.0.1:{closed}"
+            expect_down += 1
+        else:
+            targets[i] = f"127.0.0.1:{ports[i % len(ports)]}"
+
+    monitor = HealthMonitor(interval=args.interval, concurrency=args.concurrency, timeout=1,
+                            load_servers=lambda: targets)
+    done = asyncio.Event()
+    lag_task = asyncio.create_task(_loop_lag(done))
+    start = time.perf_counter()
+    await monitor.start()
+
+    # First full sweep: every server probed once (spread over one interval)
+    while monitor.stats()["servers"] < args.servers or monitor.counts()["unknown"]:
+        await asyncio.sleep(0.05)
+    first_sweep = time.perf_counter() - start
+    await asyncio.sleep(max(0.0, args.seconds - first_sweep))
+    elapsed = time.perf_counter() - start
+    stats = monitor.stats()
+    await monitor.aclose()
+    done.set()
+    lags = sorted(await lag_task)
+    for server in servers:
+        server.close()
+
+    print(json.dumps({
+        "servers": args.servers,
+        "interval_s": args.interval,
+        "concurrency": args.concurrency,
+        "first_sweep_s": round(first_sweep, 3),
+        "probes": stats["probes_total"],
+        "probes_per_sec": round(stats["probes_total"] / elapsed, 1),
+        "expected_probes_per_sec": round(args.servers / args.interval, 1),
+        "status": stats["status"],
+        "expected_down": expect_down,
+        "late_ms_max": stats["late_ms_max"],
+        "loop_lag_ms": {
+            "p50": round(statistics.median(lags) * 1000, 2),
+            "p99": round(lags[int(0.99 * (len(lags) - 1))] * 1000, 2),
+            "max": round(lags[-1] * 1000, 2),
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--servers", type=int, default=2000)
+    parser.add_argument("--listeners", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,407 @@
+"""End-to-end load test: the real app over HTTP, upstreams replaced by local stand-ins.
+
+Boots ``backend.main:app`` under uvicorn in a child process, against a
+scratch database created on the Postgres server in DATABASE_URL and
+dropped afterwards (``--keep-db`` leaves it, ``--no-scratch-db`` uses
+DATABASE_URL as is). ApiCaller talks to an httpx MockTransport and
+AiService to fake SDK clients, both with a fixed simulated latency, so
+runs are repeatable and never leave the machine. /run-code runs for real.
+
+Each concurrency level drives a weighted mix of operations for a fixed
+number of requests; the operation sequence comes from ``--seed``. The
+report is JSON with p50/p95/p99 latency per operation and overall, plus
+requests per second, and the commit it ran against:
+
+    python -m benchmarks.bench_load --mix mixed --concurrency 1,10,50 --requests 2000 -o before.json
+    python -m benchmarks.bench_load --compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import httpx
+import psycopg2
+from psycopg2.extensions import make_dsn, parse_dsn
+
+UPSTREAM_URL = "http://upstream.bench/items"
+CODE_SNIPPET = "print(sum(range(10000)))\n"
+
+# Operation -> weight; weights only need to be relative to each other
+MIXES = {
+    "mixed": {"me": 20, "list_websites": 15, "list_tasks": 10, "create_task": 8, "list_notes": 8,
+              "search_notes": 5, "create_note": 4, "call_api": 15, "ai_chat": 8, "run_code": 5, "login": 2},
+    "auth": {"me": 80, "login": 20},
+    "crud": {"list_websites": 25, "list_tasks": 20, "create_task": 15, "list_notes": 15, "search_notes": 10,
+             "create_note": 10, "create_website": 5},
+    "upstream": {"call_api": 60, "ai_chat": 40},
+    "run_code": {"run_code": 100},
+}
+
+
+# --- Upstream stand-ins (installed in the server process) ---
+
+def _mock_transport(latency: float) -> httpx.MockTransport:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        return httpx.Response(200, json={"items": [{"id": i, "name": f"item-{i}"} for i in range(20)]})
+
+    return httpx.MockTransport(handler)
+
+
+class _FakeAnthropic:
+    def __init__(self, latency: float):
+        self.messages = SimpleNamespace(create=self._create)
+        self.latency = latency
+
+    async def _create(self, model, max_tokens, system, messages):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(
+            content=[SimpleNamespace(text="Simulated reply")],
+            model=model,
+            usage=SimpleNamespace(input_tokens=len(messages[0]["content"].split()), output_tokens=2),
+        )
+
+    async def close(self):
+        pass
+
+
+class _FakeOpenAI:
+    def __init__(self, latency: float):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.latency = latency
+
+    async def _create(self, model, messages):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Simulated reply"))],
+            model=model,
+            usage=SimpleNamespace(prompt_tokens=len(messages[-1]["content"].split()), completion_tokens=2),
+        )
+
+    async def close(self):
+        pass
+
+
+def serve(port: int, upstream_latency: float, ai_latency: float):
+    """Run the app with stand-in upstreams; used as the child process."""
+    import uvicorn
+
+    from backend import main as app_module
+    from backend.api_caller import ApiCaller
+
+    app_module.api_caller = ApiCaller(transport=_mock_transport(upstream_latency))
+    app_module.ai_service._client_factory = (
+        lambda provider, api_key, base_url: _FakeAnthropic(ai_latency) if provider == "anthropic"
+        else _FakeOpenAI(ai_latency)
+    )
+    uvicorn.run(app_module.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# --- Load generator ---
+
+class Session:
+    def __init__(self, client: httpx.AsyncClient, users: list, rng: random.Random):
+        self.client = client
+        self.users = users
+        self.rng = rng
+
+    async def me(self, user):
+        return await self.client.get("/me", headers=user["headers"])
+
+    async def login(self, user):
+        return await self.client.post("/auth/login", data=user["credentials"])
+
+    async def list_websites(self, user):
+        return await self.client.get("/websites", params={"limit": 50}, headers=user["headers"])
+
+    async def list_tasks(self, user):
+        status = self.rng.choice(("Pending", "Done"))
+        return await self.client.get("/tasks", params={"status": status, "limit": 50}, headers=user["headers"])
+
+    async def list_notes(self, user):
+        return await self.client.get("/notes", params={"limit": 50}, headers=user["headers"])
+
+    async def search_notes(self, user):
+        word = self.rng.choice(("deploy", "backup", "invoice", "server"))
+        return await self.client.get("/notes/search", params={"q": word}, headers=user["headers"])
+
+    async def create_task(self, user):
+        return await self.client.post("/tasks", headers=user["headers"], json=_task(self.rng))
+
+    async def create_note(self, user):
+        return await self.client.post("/notes", headers=user["headers"], json=_note(self.rng))
+
+    async def create_website(self, user):
+        return await self.client.post("/websites", headers=user["headers"], json=_website(self.rng))
+
+    async def call_api(self, user):
+        return await self.client.post("/call-api", headers=user["headers"], json={"url": UPSTREAM_URL})
+
+    async def ai_chat(self, user):
+        body = {"prompt": "Summarize the deployment notes", "provider": self.rng.choice(("anthropic", "openai")),
+                "api_key": "bench", "cache": False}
+        return await self.client.post("/ai/chat", headers=user["headers"], json=body)
+
+    async def run_code(self, user):
+        return await self.client.post("/run-code", headers=user["headers"], json={"code": CODE_SNIPPET})
+
+
+def _task(rng: random.Random) -> dict:
+    return {"task_name": f"task-{rng.randrange(10**6)}", "category": rng.choice(("Ops", "Dev", "Billing")),
+            "client": rng.choice(("Acme", "Globex", "Initech")), "status": rng.choice(("Pending", "Done"))}
+
+
+def _note(rng: random.Random) -> dict:
+    words = rng.sample(("deploy", "backup", "invoice", "server", "rotate", "keys", "dns", "cert"), 4)
+    return {"content": " ".join(words), "tags": ",".join(words[:2])}
+
+
+def _website(rng: random.Random) -> dict:
+    n = rng.randrange(10**6)
+    return {"name": f"site-{n}", "link": f"https://site-{n}.example", "category": rng.choice(("Tools", "Docs"))}
+
+
+def _percentiles(samples: list) -> dict:
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+
+    def rank(q):
+        # Nearest-rank percentile
+        return round(samples[max(0, min(len(samples) - 1, int(q * len(samples) + 0.5) - 1))] * 1000, 2)
+
+    return {"count": len(samples), "p50_ms": rank(0.50), "p95_ms": rank(0.95), "p99_ms": rank(0.99),
+            "max_ms": round(samples[-1] * 1000, 2)}
+
+
+async def _setup(client: httpx.AsyncClient, users: int, seed_rows: int, rng: random.Random) -> list:
+    accounts = []
+    for i in range(users):
+        credentials = {"username": f"bench-{i}-{secrets.token_hex(3)}", "password": secrets.token_hex(8)}
+        (await client.post("/auth/register", json=credentials)).raise_for_status()
+        response = await client.post("/auth/login", data=credentials)
+        response.raise_for_status()
+        accounts.append({"credentials": credentials,
+                         "headers": {"Authorization": f"Bearer {response.json()['access_token']}"}})
+    headers = accounts[0]["headers"]
+    for make, path in ((_website, "/websites"), (_task, "/tasks"), (_note, "/notes")):
+        for _ in range(seed_rows):
+            (await client.post(path, headers=headers, json=make(rng))).raise_for_status()
+    return accounts
+
+
+async def _run_level(session: Session, mix: dict, concurrency: int, requests: int) -> dict:
+    operations, weights = zip(*mix.items())
+    # Drawn up front so the sequence depends only on the seed, not on timing
+    plan = session.rng.choices(operations, weights, k=requests)
+    latencies = {op: [] for op in operations}
+    errors = {op: 0 for op in operations}
+    statuses = {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < len(plan):
+            index = next_index
+            next_index += 1
+            op = plan[index]
+            user = session.users[index % len(session.users)]
+            start = time.perf_counter()
+            try:
+                response = await getattr(session, op)(user)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            latencies[op].append(time.perf_counter() - start)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if not 200 <= status < 300:
+                errors[op] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(requests / elapsed, 1),
+        "errors": sum(errors.values()),
+        "statuses": statuses,
+        "overall": _percentiles([s for samples in latencies.values() for s in samples]),
+        "operations": {op: {**_percentiles(latencies[op]), "errors": errors[op]} for op in operations},
+    }
+
+
+# --- Scratch database and server process ---
+
+def _scratch_database(database_url: str) -> tuple:
+    """Create an empty database next to DATABASE_URL's; returns (dsn, name)."""
+    name = f"bench_{secrets.token_hex(4)}"
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f'CREATE DATABASE "{name}"')
+    conn.close()
+    return make_dsn(database_url, dbname=name), name
+
+
+def _drop_database(database_url: str, name: str):
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+    conn.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_ready(base_url: str, server: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}")
+            try:
+                if (await client.get("/openapi.json")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not become ready in time")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _drive(args, base_url: str) -> list:
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        users = await _setup(client, args.users, args.seed_rows, rng)
+        session = Session(client, users, rng)
+        if args.warmup:
+            await _run_level(session, MIXES[args.mix], min(args.concurrency), args.warmup)
+        return [await _run_level(session, MIXES[args.mix], c, args.requests) for c in args.concurrency]
+
+
+def run(args) -> dict:
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        sys.exit("DATABASE_URL must point at a reachable Postgres (e.g. the docker-compose db service)")
+    scratch = None
+    if args.scratch_db:
+        database_url, scratch = _scratch_database(database_url)
+    port = _free_port()
+    env = {**os.environ, "DATABASE_URL": database_url, "AI_SDK_WARMUP": "lazy"}
+    command = [sys.executable, "-m", "benchmarks.bench_load", "--serve", str(port),
+               "--upstream-latency", str(args.upstream_latency), "--ai-latency", str(args.ai_latency)]
+    server = subprocess.Popen(command, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+
+    async def main():
+        await _wait_ready(base_url, server)
+        return await _drive(args, base_url)
+
+    try:
+        levels = asyncio.run(main())
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        if scratch and not args.keep_db:
+            _drop_database(os.environ["DATABASE_URL"], scratch)
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "database": parse_dsn(database_url).get("dbname"),
+        "config": {"mix": args.mix, "weights": MIXES[args.mix], "requests": args.requests, "users": args.users,
+                   "seed": args.seed, "seed_rows": args.seed_rows, "upstream_latency_s": args.upstream_latency,
+                   "ai_latency_s": args.ai_latency},
+        "levels": levels,
+    }
+
+
+def compare(before_path: str, after_path: str) -> dict:
+    """Per concurrency level and operation: rps and p50/p95/p99 change from before to after, in percent."""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    def change(old, new):
+        return round((new - old) / old * 100, 1) if old else None
+
+    old_levels = {level["concurrency"]: level for level in before["levels"]}
+    levels = []
+    for level in after["levels"]:
+        old = old_levels.get(level["concurrency"])
+        if old is None:
+            continue
+        operations = {}
+        for op, stats in level["operations"].items():
+            old_stats = old["operations"].get(op)
+            if old_stats and old_stats.get("count") and stats.get("count"):
+                operations[op] = {f"{p}_change_pct": change(old_stats[p], stats[p])
+                                  for p in ("p50_ms", "p95_ms", "p99_ms")}
+        levels.append({
+            "concurrency": level["concurrency"],
+            "requests_per_sec": [old["requests_per_sec"], level["requests_per_sec"]],
+            "requests_per_sec_change_pct": change(old["requests_per_sec"], level["requests_per_sec"]),
+            "overall": {f"{p}_change_pct": change(old["overall"][p], level["overall"][p])
+                        for p in ("p50_ms", "p95_ms", "p99_ms")},
+            "operations": operations,
+        })
+    return {"before": before.get("commit"), "after": after.get("commit"), "levels": levels}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 10, 50],
+                        help="Comma-separated concurrency levels, run in order")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=100, help="Unreported requests before the first level")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--seed-rows", type=int, default=200, help="Rows per table created before the run")
+    parser.add_argument("--upstream-latency", type=float, default=0.02, help="Simulated /call-api upstream, seconds")
+    parser.add_argument("--ai-latency", type=float, default=0.25, help="Simulated AI provider, seconds")
+    parser.add_argument("--no-scratch-db", dest="scratch_db", action="store_false")
+    parser.add_argument("--keep-db", action="store_true")
+    parser.add_argument("-o", "--output", help="Also write the JSON report here")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Diff two saved reports")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.upstream_latency, args.ai_latency)
+        sys.exit(0)
+    report = compare(*args.compare) if args.compare else run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
@@ -33,7 +33,7 @@ export default function AiChat() {
     setLoading(true);
     try {
       const apiBase = import.meta.env.MODE === "production" ? "" : (import.meta.env.VITE_API_URL || "http://localhost:8000");
-      const res = await fetch(`${apiBase}/ai/chat`, {
+      const res = await fetch(`${apiBase}/ai/chat/stream`, {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -46,8 +46,29 @@ export default function AiChat() {
         }),
       });
       if (handleAuthError(res)) return;
-      const data = await res.json();
-      setMessages((m) => [...m, { role: "assistant", content: data.response || data.error }]);
+      if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+
+      // Server-Sent Events: append each token delta to the assistant message as it arrives
+      setMessages((m) => [...m, { role: "assistant", content: "" }]);
+      const appendToReply = (text: string) =>
+        setMessages((m) => [...m.slice(0, -1), { role: "assistant", content: m[m.length - 1].content + text }]);
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop() || "";
+        for (const raw of events) {
+          const dataLine = raw.split("\n").find((line) => line.startsWith("data: "));
+          if (!dataLine) continue;
+          const event = JSON.parse(dataLine.slice(6));
+          if (event.type === "delta") appendToReply(event.text);
+          else if (event.type === "error") appendToReply(`Error: ${event.error}`);
+        }
+      }
     } catch (e: any) {
       setMessages((m) => [...m, { role: "assistant", content: `Error: ${e.message}` }]);
     } finally {
@@ -6,6 +6,7 @@ export default function CodeRunner() {
   const [code, setCode] = useState(`# System ready: PyTool Neural Environment\nprint("PyTool Kernel 2.0.1 Initialized... 🚀")\n\n# Secure code sandbox\ndef security_audit():\n    print("Access Granted: Authorized Environment")\n\nsecurity_audit()`);
   const [output, setOutput] = useState("");
   const [loading, setLoading] = useState(false);
+  const [timing, setTiming] = useState("");
 
   const token = localStorage.getItem("token");
 
@@ -22,9 +23,10 @@ export default function CodeRunner() {
   const runCode = async () => {
     setLoading(true);
     setOutput("");
+    setTiming("");
     try {
       const apiBase = import.meta.env.MODE === "production" ? "" : (import.meta.env.VITE_API_URL || "http://localhost:8000");
-      const res = await fetch(`${apiBase}/run-code`, {
+      const res = await fetch(`${apiBase}/run-code/stream`, {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -33,8 +35,43 @@ export default function CodeRunner() {
         body: JSON.stringify({ code }),
       });
       if (handleAuthError(res)) return;
-      const data = await res.json();
-      setOutput(data.success ? data.output : `❌ System Error:\n${data.error}`);
+      if (!res.ok || !res.body) {
+        const data = await res.json().catch(() => ({ detail: `HTTP ${res.status}` }));
+        setOutput(res.status === 429 ? `⏳ Sandbox busy: ${data.detail}` : `❌ System Error:\n${data.detail}`);
+        return;
+      }
+
+      // Server-Sent Events: stdout/stderr chunks are appended as the script prints them
+      setTiming("Queued");
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop() || "";
+        for (const raw of events) {
+          const dataLine = raw.split("\n").find((line) => line.startsWith("data: "));
+          if (!dataLine) continue;
+          const event = JSON.parse(dataLine.slice(6));
+          if (event.type === "started") {
+            setTiming("Running");
+          } else if (event.type === "stdout" || event.type === "stderr") {
+            setOutput((o) => o + event.data);
+          } else if (event.type === "done") {
+            if (event.truncated) setOutput((o) => o + "\n✂️ Output truncated: limit exceeded, process stopped");
+            else if (event.reason === "timeout") setOutput((o) => o + "\n⏱️ Timed out");
+            else if (event.reason === "cpu_limit") setOutput((o) => o + "\n⏱️ CPU time limit exceeded");
+            else if (!event.success) setOutput((o) => o + `\n❌ Exited with ${event.reason || "an error"}`);
+            const usage = event.cpu_user_ms != null
+              ? ` · CPU ${Math.round(event.cpu_user_ms + event.cpu_sys_ms)}ms · RSS ${(event.peak_rss_kb / 1024).toFixed(1)}MB`
+              : "";
+            setTiming(`Queued ${Math.round(event.queue_ms)}ms · Ran ${Math.round(event.run_ms ?? 0)}ms${usage}`);
+          }
+        }
+      }
     } catch (e: any) {
       setOutput(`❌ Sandbox connection failed: ${e.message}`);
     } finally {
@@ -90,7 +127,7 @@ export default function CodeRunner() {
       <div className="bg-zinc-950 border border-zinc-800 rounded-[2rem] p-8 shadow-inner">
         <div className="flex items-center gap-2 mb-4">
           <div className="w-2 h-2 rounded-full bg-zinc-800"></div>
-          <div className="text-[10px] font-black uppercase tracking-[0.3em] text-zinc-500">System Standby</div>
+          <div className="text-[10px] font-black uppercase tracking-[0.3em] text-zinc-500">{timing || "System Standby"}</div>
         </div>
         <pre className="text-zinc-300 font-bold font-mono text-sm h-40 overflow-auto whitespace-pre-wrap custom-scrollbar selection:bg-emerald-500/30">
           {output || ">>> Initialize kernel to see stdout results..."}
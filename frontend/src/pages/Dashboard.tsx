@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { Globe, Server, CheckSquare, FileText, Plus, X, ExternalLink, Edit2, Filter, Activity, Copy, Check, Calendar, Clock, Image as ImageIcon, Link as LinkIcon, Hash } from "lucide-react";
 
 type Tab = "Websites" | "Servers" | "Tasks" | "Notes";
@@ -37,7 +37,7 @@ interface NoteData {
     content: string;
     tags: string;
     ref_link: string;
-    images: string; // JSON string of base64
+    images: string; // JSON string of attachment IDs
     date_created: string;
 }
 
@@ -75,6 +75,11 @@ export default function Dashboard() {
     const [newNote, setNewNote] = useState<NoteData>({ content: "", tags: "", ref_link: "", images: "[]", date_created: "" });
     const [noteTagFilter, setNoteTagFilter] = useState("All");
 
+    // Server-side paging: filter options come from /{resource}/facets, pages from X-Next-Cursor
+    const [facets, setFacets] = useState<Record<string, string[]>>({});
+    const [nextCursors, setNextCursors] = useState<Record<string, string | null>>({});
+    const nextCursor = nextCursors[activeTab.toLowerCase()] ?? null;
+
     const [loading, setLoading] = useState(false);
     const [copiedIp, setCopiedIp] = useState<number | null>(null);
 
@@ -102,50 +107,144 @@ export default function Dashboard() {
     };
 
     useEffect(() => {
-        if (activeTab === "Websites") fetchWebsites();
-        if (activeTab === "Servers") fetchServers();
-        if (activeTab === "Tasks") fetchTasks();
-        if (activeTab === "Notes") fetchNotes();
+        fetchFacets(activeTab.toLowerCase());
     }, [activeTab]);
 
+    // Each list loads once per filter change; after that the change feed keeps it current
+    useEffect(() => { fetchWebsites(); }, [webCategoryFilter]);
+    useEffect(() => { fetchServers(); }, [serverClientFilter, serverProviderFilter]);
+    useEffect(() => { fetchTasks(); }, [taskCategoryFilter, taskClientFilter, taskStatusFilter]);
+    useEffect(() => { fetchNotes(); }, [noteTagFilter]);
+
+    // Read by the change feed, which outlives any single render
+    const live = useRef({ connected: false, filters: {} as Record<string, Record<string, string>>, nextCursors: {} as Record<string, string | null>, reload: () => {} });
+    live.current.filters = {
+        websites: { category: webCategoryFilter },
+        servers: { client: serverClientFilter, provider: serverProviderFilter },
+        tasks: { category: taskCategoryFilter, client: taskClientFilter, status: taskStatusFilter },
+        notes: { tag: noteTagFilter },
+    };
+    live.current.nextCursors = nextCursors;
+    live.current.reload = () => { fetchWebsites(); fetchServers(); fetchTasks(); fetchNotes(); };
+
+    useEffect(() => {
+        const controller = new AbortController();
+        let version: number | null = null;
+        let retry: ReturnType<typeof setTimeout>;
+
+        const matches = (table: string, row: any) => Object.entries(live.current.filters[table] || {}).every(([key, value]) => {
+            if (value === "All") return true;
+            if (key === "tag") return (row.tags || "").split(",").map((t: string) => t.trim()).includes(value);
+            return row[key] === value;
+        });
+
+        const upsert = (rows: any[], table: string, row: any) => {
+            const index = rows.findIndex((r) => r.id === row.id);
+            const keep = matches(table, row);
+            if (index >= 0) return keep ? rows.map((r, i) => (i === index ? row : r)) : rows.filter((_, i) => i !== index);
+            // New rows sort last by id; they belong to a page not loaded yet while more pages remain
+            return keep && !live.current.nextCursors[table] ? [...rows, row] : rows;
+        };
+
+        const applyChange = (change: { table: string; row: any }) => {
+            if (change.table === "websites") setWebsites((rows) => upsert(rows, "websites", change.row));
+            if (change.table === "servers") setServers((rows) => upsert(rows, "servers", change.row));
+            if (change.table === "tasks") setTasks((rows) => upsert(rows, "tasks", change.row));
+            if (change.table === "notes") setNotes((rows) => upsert(rows, "notes", change.row));
+        };
+
+        // Server-Sent Events over fetch (EventSource cannot send the Authorization header)
+        const connect = async () => {
+            try {
+                const query = version !== null ? `?since=${version}` : "";
+                const res = await authFetch(`${apiBase}/changes/stream${query}`, { signal: controller.signal });
+                if (handleAuthError(res) || !res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+                live.current.connected = true;
+                const reader = res.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = "";
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const events = buffer.split("\n\n");
+                    buffer = events.pop() || "";
+                    for (const raw of events) {
+                        const dataLine = raw.split("\n").find((line) => line.startsWith("data: "));
+                        if (!dataLine) continue;
+                        const event = JSON.parse(dataLine.slice(6));
+                        if (event.type === "ready" && version === null) version = event.version;
+                        if (event.type === "change") { applyChange(event); version = event.version; }
+                        if (event.type === "reset") { version = null; live.current.reload(); }
+                    }
+                }
+            } catch (e: any) {
+                if (controller.signal.aborted) return;
+                console.error("Change feed disconnected:", e);
+            }
+            live.current.connected = false;
+            // Streams end on purpose every few minutes too; resume from the last applied version
+            if (!controller.signal.aborted) retry = setTimeout(connect, 1000);
+        };
+        connect();
+        return () => { controller.abort(); clearTimeout(retry); };
+    }, []);
+
 
     // --- API Functions ---
-    const fetchWebsites = async () => {
+    const fetchPage = async (resource: string, filters: Record<string, string>, cursor?: string | null) => {
+        const params = new URLSearchParams();
+        Object.entries(filters).forEach(([key, value]) => { if (value !== "All") params.set(key, value); });
+        if (cursor) params.set("cursor", cursor);
+        const res = await authFetch(`${apiBase}/${resource}?${params}`);
+        if (handleAuthError(res)) return null;
+        setNextCursors((c) => ({ ...c, [resource]: res.headers.get("X-Next-Cursor") }));
+        return res.json();
+    };
+
+    const fetchFacets = async (resource: string) => {
         try {
-            const res = await authFetch(`${apiBase}/websites`);
+            const res = await authFetch(`${apiBase}/${resource}/facets`);
             if (handleAuthError(res)) return;
-            const data = await res.json();
-            setWebsites(data);
+            setFacets(await res.json());
+        } catch (e) { console.error(`Failed to fetch ${resource} facets:`, e); }
+    };
+
+    const fetchWebsites = async (cursor?: string | null) => {
+        try {
+            const data = await fetchPage("websites", { category: webCategoryFilter }, cursor);
+            if (data) setWebsites(cursor ? [...websites, ...data] : data);
         } catch (e) { console.error("Failed to fetch websites:", e); }
     };
 
-    const fetchServers = async () => {
+    const fetchServers = async (cursor?: string | null) => {
         try {
-            const res = await authFetch(`${apiBase}/servers`);
-            if (handleAuthError(res)) return;
-            const data = await res.json();
-            setServers(data);
+            const data = await fetchPage("servers", { client: serverClientFilter, provider: serverProviderFilter }, cursor);
+            if (data) setServers(cursor ? [...servers, ...data] : data);
         } catch (e) { console.error("Failed to fetch servers:", e); }
     };
 
-    const fetchTasks = async () => {
+    const fetchTasks = async (cursor?: string | null) => {
         try {
-            const res = await authFetch(`${apiBase}/tasks`);
-            if (handleAuthError(res)) return;
-            const data = await res.json();
-            setTasks(data);
+            const data = await fetchPage("tasks", { category: taskCategoryFilter, client: taskClientFilter, status: taskStatusFilter }, cursor);
+            if (data) setTasks(cursor ? [...tasks, ...data] : data);
         } catch (e) { console.error("Failed to fetch tasks:", e); }
     };
 
-    const fetchNotes = async () => {
+    const fetchNotes = async (cursor?: string | null) => {
         try {
-            const res = await authFetch(`${apiBase}/notes`);
-            if (handleAuthError(res)) return;
-            const data = await res.json();
-            setNotes(data);
+            const data = await fetchPage("notes", { tag: noteTagFilter }, cursor);
+            if (data) setNotes(cursor ? [...notes, ...data] : data);
         } catch (e) { console.error("Failed to fetch notes:", e); }
     };
 
+    const loadMore = () => {
+        if (activeTab === "Websites") fetchWebsites(nextCursor);
+        if (activeTab === "Servers") fetchServers(nextCursor);
+        if (activeTab === "Tasks") fetchTasks(nextCursor);
+        if (activeTab === "Notes") fetchNotes(nextCursor);
+    };
+
     const saveWebsite = async () => {
         const websiteToSave = editingWebsite || newWebsite;
         if (!websiteToSave.name || !websiteToSave.link) return;
@@ -157,7 +256,8 @@ export default function Dashboard() {
             setIsWebModalOpen(false);
             setEditingWebsite(null);
             setNewWebsite({ name: "", link: "", icon: "", description: "", category: "General" });
-            fetchWebsites();
+            // The change feed delivers the saved row; only reload when it is not connected
+            if (!live.current.connected) fetchWebsites();
         } catch (e) { console.error("Failed to save website:", e); } finally { setLoading(false); }
     };
 
@@ -172,7 +272,7 @@ export default function Dashboard() {
             setIsServerModalOpen(false);
             setEditingServer(null);
             setNewServer({ server_name: "", provider: "", provider_link: "", client: "", server_ip: "", description: "" });
-            fetchServers();
+            if (!live.current.connected) fetchServers();
         } catch (e) { console.error("Failed to save server:", e); } finally { setLoading(false); }
     };
 
@@ -190,7 +290,7 @@ export default function Dashboard() {
             setIsTaskModalOpen(false);
             setEditingTask(null);
             setNewTask({ task_name: "", category: "General", client: "Internal", status: "Pending", date_created: "", date_completed: "" });
-            fetchTasks();
+            if (!live.current.connected) fetchTasks();
         } catch (e) { console.error("Failed to save task:", e); } finally { setLoading(false); }
     };
 
@@ -207,7 +307,7 @@ export default function Dashboard() {
             setIsNoteModalOpen(false);
             setEditingNote(null);
             setNewNote({ content: "", tags: "", ref_link: "", images: "[]", date_created: "" });
-            fetchNotes();
+            if (!live.current.connected) fetchNotes();
         } catch (e) { console.error("Failed to save note:", e); } finally { setLoading(false); }
     };
 
@@ -223,21 +323,27 @@ export default function Dashboard() {
         for (let i = 0; i < items.length; i++) {
             if (items[i].type.indexOf("image") !== -1) {
                 const file = items[i].getAsFile();
-                if (file) {
-                    const reader = new FileReader();
-                    reader.onload = (event) => {
-                        const base64 = event.target?.result as string;
-                        const currentImages = JSON.parse(editingNote ? editingNote.images : newNote.images);
-                        const updatedImages = JSON.stringify([...currentImages, base64]);
-                        if (editingNote) setEditingNote({ ...editingNote, images: updatedImages });
-                        else setNewNote({ ...newNote, images: updatedImages });
-                    };
-                    reader.readAsDataURL(file);
-                }
+                if (file) uploadNoteImage(file);
             }
         }
     };
 
+    const uploadNoteImage = async (file: File) => {
+        try {
+            const form = new FormData();
+            form.append("file", file);
+            const res = await authFetch(`${apiBase}/attachments`, { method: "POST", body: form });
+            if (handleAuthError(res) || !res.ok) return;
+            const { id } = await res.json();
+            const addImage = (note: NoteData) => ({ ...note, images: JSON.stringify([...JSON.parse(note.images || "[]"), id]) });
+            if (editingNote) setEditingNote(n => n && addImage(n));
+            else setNewNote(n => addImage(n));
+        } catch (e) { console.error("Failed to upload image:", e); }
+    };
+
+    // Legacy notes may still hold inline data URLs until the backend migration has run
+    const attachmentUrl = (ref: string) => ref.startsWith("data:") ? ref : `${apiBase}/attachments/${ref}`;
+
     const removeImage = (index: number) => {
         const currentImages = JSON.parse(editingNote ? editingNote.images : newNote.images);
         const updatedImages = JSON.stringify(currentImages.filter((_: any, i: number) => i !== index));
@@ -245,32 +351,15 @@ export default function Dashboard() {
         else setNewNote({ ...newNote, images: updatedImages });
     };
 
-    const webCategories = ["All", ...Array.from(new Set(websites.map(s => s.category || "General")))];
-    const filteredWebsites = webCategoryFilter === "All" ? websites : websites.filter(s => s.category === webCategoryFilter);
+    const webCategories = ["All", ...(facets.category || [])];
 
-    const serverClients = ["All", ...Array.from(new Set(servers.map(s => s.client || "Self")))];
-    const serverProviders = ["All", ...Array.from(new Set(servers.map(s => s.provider || "Unknown")))];
-    const filteredServers = servers.filter(s => {
-        const clientMatch = serverClientFilter === "All" || s.client === serverClientFilter;
-        const providerMatch = serverProviderFilter === "All" || s.provider === serverProviderFilter;
-        return clientMatch && providerMatch;
-    });
+    const serverClients = ["All", ...(facets.client || [])];
+    const serverProviders = ["All", ...(facets.provider || [])];
 
-    const taskCategories = ["All", ...Array.from(new Set(tasks.map(t => t.category || "General")))];
-    const taskClients = ["All", ...Array.from(new Set(tasks.map(t => t.client || "Internal")))];
+    const taskCategories = ["All", ...(facets.category || [])];
     const taskStatuses = ["All", "Pending", "In Progress", "Completed", "On Hold"];
-    const filteredTasks = tasks.filter(t => {
-        const categoryMatch = taskCategoryFilter === "All" || t.category === taskCategoryFilter;
-        const clientMatch = taskClientFilter === "All" || t.client === taskClientFilter;
-        const statusMatch = taskStatusFilter === "All" || t.status === taskStatusFilter;
-        return categoryMatch && clientMatch && statusMatch;
-    });
-
-    const allNoteTags = notes.flatMap(n => (n.tags || "").split(",").map(t => t.trim())).filter(t => t !== "");
-    const noteTags = ["All", ...Array.from(new Set(allNoteTags))];
-    const filteredNotes = noteTagFilter === "All"
-        ? notes
-        : notes.filter(n => (n.tags || "").split(",").map(t => t.trim()).includes(noteTagFilter));
+
+    const noteTags = ["All", ...(facets.tag || [])];
 
     const tabs: { id: Tab; icon: any }[] = [
         { id: "Websites", icon: Globe },
@@ -325,7 +414,7 @@ export default function Dashboard() {
 
             {/* Filters */}
             <div className="flex flex-wrap gap-4">
-                {activeTab === "Websites" && websites.length > 0 && (
+                {activeTab === "Websites" && webCategories.length > 1 && (
                     <div className="flex items-center gap-3 overflow-x-auto pb-2 scrollbar-hide text-zinc-500 text-[10px] font-black uppercase tracking-widest whitespace-nowrap">
                         <Filter size={12} /> Category:
                         {webCategories.map(cat => (
@@ -333,7 +422,7 @@ export default function Dashboard() {
                         ))}
                     </div>
                 )}
-                {activeTab === "Servers" && servers.length > 0 && (
+                {activeTab === "Servers" && (
                     <div className="flex flex-wrap gap-6 items-center">
                         <div className="flex items-center gap-3 overflow-x-auto pb-2 scrollbar-hide text-zinc-500 text-[10px] font-black uppercase tracking-widest whitespace-nowrap">
                             <Filter size={12} /> Client:
@@ -349,7 +438,7 @@ export default function Dashboard() {
                         </div>
                     </div>
                 )}
-                {activeTab === "Tasks" && tasks.length > 0 && (
+                {activeTab === "Tasks" && (
                     <div className="flex flex-wrap gap-6 items-center">
                         <div className="flex items-center gap-3 overflow-x-auto pb-2 scrollbar-hide text-zinc-500 text-[10px] font-black uppercase tracking-widest whitespace-nowrap">
                             <Filter size={12} /> Status:
@@ -365,7 +454,7 @@ export default function Dashboard() {
                         </div>
                     </div>
                 )}
-                {activeTab === "Notes" && notes.length > 0 && (
+                {activeTab === "Notes" && noteTags.length > 1 && (
                     <div className="flex items-center gap-3 overflow-x-auto pb-2 scrollbar-hide text-zinc-500 text-[10px] font-black uppercase tracking-widest whitespace-nowrap">
                         <Filter size={12} /> Tag:
                         {noteTags.map(tag => (
@@ -379,7 +468,7 @@ export default function Dashboard() {
             <div className="min-h-[400px]">
                 {activeTab === "Websites" && (
                     <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-6">
-                        {filteredWebsites.map((site, i) => (
+                        {websites.map((site, i) => (
                             <div key={i} className="group relative bg-zinc-900/30 border border-zinc-800/50 p-6 rounded-3xl hover:border-emerald-500/50 hover:bg-zinc-800/40 transition-all duration-500 hover:-translate-y-2 overflow-hidden flex flex-col h-full shadow-xl">
                                 <div className="absolute -top-12 -right-12 w-32 h-32 bg-emerald-500/10 blur-[50px] rounded-full group-hover:bg-emerald-500/20 transition-all duration-500"></div>
                                 <div className="flex items-start justify-between mb-4 relative z-10">
@@ -404,7 +493,7 @@ export default function Dashboard() {
 
                 {activeTab === "Servers" && (
                     <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-6">
-                        {filteredServers.map((server, i) => (
+                        {servers.map((server, i) => (
                             <div key={i} className="group relative bg-zinc-900/30 border border-zinc-800/50 p-6 rounded-3xl hover:border-emerald-500/50 hover:bg-zinc-800/40 transition-all duration-500 hover:-translate-y-2 overflow-hidden flex flex-col h-full shadow-xl">
                                 <div className="absolute -top-12 -right-12 w-32 h-32 bg-emerald-500/10 blur-[50px] rounded-full group-hover:bg-emerald-500/20 transition-all duration-500"></div>
                                 <div className="flex items-start justify-between mb-4 relative z-10">
@@ -432,7 +521,7 @@ export default function Dashboard() {
 
                 {activeTab === "Tasks" && (
                     <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-6">
-                        {filteredTasks.map((task, i) => (
+                        {tasks.map((task, i) => (
                             <div key={i} className="group relative bg-zinc-900/30 border border-zinc-800/50 p-6 rounded-3xl hover:border-emerald-500/50 hover:bg-zinc-800/40 transition-all duration-500 hover:-translate-y-2 overflow-hidden flex flex-col h-full shadow-xl">
                                 <div className="absolute -top-12 -right-12 w-32 h-32 bg-emerald-500/10 blur-[50px] rounded-full group-hover:bg-emerald-500/20 transition-all duration-500"></div>
                                 <div className="flex items-start justify-between mb-4 relative z-10">
@@ -456,7 +545,7 @@ export default function Dashboard() {
 
                 {activeTab === "Notes" && (
                     <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-6">
-                        {filteredNotes.map((note, i) => (
+                        {notes.map((note, i) => (
                             <div key={i} className="group relative bg-zinc-900/30 border border-zinc-800/50 p-6 rounded-3xl hover:border-emerald-500/50 hover:bg-zinc-800/40 transition-all duration-500 hover:-translate-y-2 overflow-hidden flex flex-col h-full shadow-xl">
                                 <div className="absolute -top-12 -right-12 w-32 h-32 bg-emerald-500/10 blur-[50px] rounded-full group-hover:bg-emerald-500/20 transition-all duration-500"></div>
                                 <div className="flex items-start justify-between mb-4 relative z-10">
@@ -478,7 +567,7 @@ export default function Dashboard() {
                                     <div className="flex gap-3 mb-6 overflow-x-auto pb-2 scrollbar-hide scroll-smooth">
                                         {JSON.parse(note.images).map((img: string, ii: number) => (
                                             <div key={ii} className="relative flex-shrink-0 group/img shadow-lg">
-                                                <img src={img} className="h-24 w-24 object-cover rounded-2xl border-2 border-zinc-800/50 hover:border-emerald-500 transition-all cursor-pointer" onClick={() => window.open(img)} />
+                                                <img src={attachmentUrl(img)} loading="lazy" className="h-24 w-24 object-cover rounded-2xl border-2 border-zinc-800/50 hover:border-emerald-500 transition-all cursor-pointer" onClick={() => window.open(attachmentUrl(img))} />
                                                 <div className="absolute inset-x-0 bottom-0 h-1/2 bg-gradient-to-t from-zinc-950/80 to-transparent opacity-0 group-hover/img:opacity-100 rounded-b-2xl transition-opacity pointer-events-none"></div>
                                             </div>
                                         ))}
@@ -491,6 +580,11 @@ export default function Dashboard() {
                         ))}
                     </div>
                 )}
+                {nextCursor && (
+                    <div className="flex justify-center pt-8">
+                        <button onClick={loadMore} className="px-6 py-2.5 rounded-xl text-xs font-black uppercase tracking-widest bg-zinc-900 text-zinc-400 border border-zinc-800 hover:border-zinc-700 hover:text-zinc-200 transition-all cursor-pointer">Load more</button>
+                    </div>
+                )}
             </div>
 
             {/* Modals are unchanged visually, just using authFetch inside handlers */}
@@ -551,7 +645,7 @@ export default function Dashboard() {
                                 <div className="flex flex-wrap gap-4">
                                     {JSON.parse(editingNote ? editingNote.images : newNote.images).map((img: string, idx: number) => (
                                         <div key={idx} className="relative group/edit rounded-2xl overflow-hidden border-2 border-zinc-800 w-24 h-24 hover:border-red-500/50 transition-all shadow-xl">
-                                            <img src={img} className="w-full h-full object-cover" />
+                                            <img src={attachmentUrl(img)} className="w-full h-full object-cover" />
                                             <button onClick={() => removeImage(idx)} className="absolute inset-0 bg-red-600/40 opacity-0 group-hover/edit:opacity-100 transition-opacity flex items-center justify-center text-white"><X size={32} /></button>
                                         </div>
                                     ))}
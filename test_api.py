@@ -1,14 +1,20 @@
+import secrets
+
 import httpx
 
-# Test health first
-r = httpx.get('http://localhost:8000/health')
-print(f"Health: {r.status_code} {r.text}")
+BASE = 'http://localhost:8000'
+
+# Check the server is up (there is no /health route; the OpenAPI schema is always served)
+r = httpx.get(f'{BASE}/openapi.json')
+print(f"OpenAPI: {r.status_code}")
 
-# Test with verbose error
-r = httpx.post('http://localhost:8000/run', json={'code': 'print(42)'})
+# Throwaway account, then run code through the sandbox
+credentials = {'username': f'smoke-{secrets.token_hex(4)}', 'password': secrets.token_hex(8)}
+r = httpx.post(f'{BASE}/auth/register', json=credentials)
+print(f"Register: {r.status_code} {r.text}")
+r = httpx.post(f'{BASE}/auth/login', data=credentials)
+headers = {'Authorization': f"Bearer {r.json()['access_token']}"}
+
+r = httpx.post(f'{BASE}/run-code', json={'code': 'print(42)'}, headers=headers)
 print(f"Run Status: {r.status_code}")
 print(f"Run Response: {r.text}")
-
-# Also try the OpenAPI docs endpoint to check if server reloaded
-r2 = httpx.get('http://localhost:8000/openapi.json')
-print(f"OpenAPI: {r2.status_code}")
@@ -1,6 +1,15 @@
+import asyncio
 import sys
 sys.path.insert(0, r'C:\DEV\mytools202')
 from backend.code_runner import CodeRunner
-runner = CodeRunner()
-result = runner.execute('print(42)')
-print(result)
+
+
+async def main():
+    runner = CodeRunner()
+    try:
+        result = await runner.run('print(42)')
+        print(result)
+    finally:
+        await runner.aclose()
+
+asyncio.run(main())